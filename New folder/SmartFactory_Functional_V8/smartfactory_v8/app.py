@@ -1,17 +1,29 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash
+from flask import Flask, Response, render_template, jsonify, request, redirect, url_for, session, flash
 from config import Config
-from database.db_manager import init_db, get_db_connection
-from services.analytics_service import calculate_kpis, get_analytics_data
+from database.db_manager import init_db, get_db_connection, read_snapshot, start_snapshot_refresher
+from services.analytics_service import calculate_kpis_json, get_analytics_data
+from services.sketch_service import record_day_sketches, remove_machine_sketches, backfill_sketches, get_percentiles
+from services.fragment_cache import render_fragment, bump_data_versions
+from jinja2 import FileSystemBytecodeCache
 from werkzeug.security import check_password_hash
+from datetime import datetime, timezone
 import random
 import csv
 import io
+import os
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
+# Share compiled template bytecode between workers and restarts
+if Config.TEMPLATE_CACHE_DIR:
+    os.makedirs(Config.TEMPLATE_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(Config.TEMPLATE_CACHE_DIR)
+
 with app.app_context():
     init_db()
+    backfill_sketches()
+    if Config.SNAPSHOT_INTERVAL: start_snapshot_refresher(Config.SNAPSHOT_INTERVAL)
 
 # Middleware
 def login_required(f):
@@ -50,10 +62,12 @@ def dashboard():
 @app.route('/machines')
 @login_required
 def machines():
-    conn = get_db_connection()
-    machines_list = conn.execute('SELECT * FROM machines').fetchall()
-    conn.close()
-    return render_template('machines.html', active_page='machines', machines=machines_list)
+    def load():
+        conn = get_db_connection()
+        machines_list = conn.execute('SELECT * FROM machines').fetchall()
+        conn.close()
+        return {'machines': machines_list}
+    return render_template('machines.html', active_page='machines', machine_table=render_fragment('machine_table', 'fragments/machine_table.html', load))
 
 @app.route('/machines/add', methods=['POST'])
 @login_required
@@ -67,7 +81,9 @@ def add_machine():
     mid = c.lastrowid
     c.execute("INSERT INTO production_logs (machine_id, date, planned_qty, actual_qty, runtime_hours) VALUES (?, DATE('now'), ?, 0, 0)", 
              (mid, int(request.form['capacity']) * 8)) # Default 8 hr shift plan
+    record_day_sketches(conn)
     
+    bump_data_versions(conn, ('machines', 'production_logs', 'kpi_sketches'))
     conn.commit()
     conn.close()
     flash(f"Machine {request.form['name']} added successfully!")
@@ -79,6 +95,8 @@ def delete_machine(id):
     conn = get_db_connection()
     conn.execute('DELETE FROM machines WHERE id = ?', (id,))
     conn.execute('DELETE FROM production_logs WHERE machine_id = ?', (id,))
+    remove_machine_sketches(conn, id)
+    bump_data_versions(conn, ('machines', 'production_logs', 'kpi_sketches'))
     conn.commit()
     conn.close()
     flash("Machine removed.")
@@ -91,6 +109,8 @@ def toggle_machine(id):
     curr = conn.execute("SELECT status FROM machines WHERE id=?", (id,)).fetchone()['status']
     new_status = 'Maintenance' if curr == 'Active' else 'Active'
     conn.execute("UPDATE machines SET status = ? WHERE id = ?", (new_status, id))
+    record_day_sketches(conn)
+    bump_data_versions(conn, ('machines', 'kpi_sketches'))
     conn.commit()
     conn.close()
     return redirect(url_for('machines'))
@@ -98,22 +118,28 @@ def toggle_machine(id):
 @app.route('/reports')
 @login_required
 def reports():
-    conn = get_db_connection()
-    logs = conn.execute('SELECT p.*, m.name as machine_name FROM production_logs p JOIN machines m ON p.machine_id = m.id ORDER BY p.date DESC').fetchall()
-    return render_template('reports.html', active_page='reports', logs=logs)
+    def load():
+        with read_snapshot() as conn:
+            logs = conn.execute('SELECT p.*, m.name as machine_name FROM production_logs p JOIN machines m ON p.machine_id = m.id ORDER BY p.date DESC').fetchall()
+        return {'logs': logs}
+    return render_template('reports.html', active_page='reports', report_table=render_fragment('report_table', 'fragments/report_table.html', load))
 
 @app.route('/alerts')
 @login_required
 def alerts():
-    conn = get_db_connection()
-    alerts = conn.execute('SELECT a.*, m.name as machine_name FROM alerts a JOIN machines m ON a.machine_id = m.id ORDER BY a.created_at DESC').fetchall()
-    return render_template('alerts.html', active_page='alerts', alerts=alerts, c=sum(1 for a in alerts if a['severity']=='Critical'), w=sum(1 for a in alerts if a['severity']=='Warning'), i=sum(1 for a in alerts if a['severity']=='Info'))
+    def load():
+        with read_snapshot() as conn:
+            alerts = conn.execute('SELECT a.*, m.name as machine_name FROM alerts a JOIN machines m ON a.machine_id = m.id ORDER BY a.created_at DESC').fetchall()
+        return {'alerts': alerts, 'c': sum(1 for a in alerts if a['severity']=='Critical'), 'w': sum(1 for a in alerts if a['severity']=='Warning'), 'i': sum(1 for a in alerts if a['severity']=='Info')}
+    return render_template('alerts.html', active_page='alerts', alert_list=render_fragment('alert_list', 'fragments/alert_list.html', load))
 
 @app.route('/analytics')
 @login_required
 def analytics():
-    data = get_analytics_data()
-    return render_template('analytics.html', active_page='analytics', rankings=data['rankings'], trend_labels=data['trend']['labels'], trend_data=data['trend']['data'])
+    def load():
+        data = get_analytics_data()
+        return {'rankings': data['rankings'], 'trend_labels': data['trend']['labels'], 'trend_data': data['trend']['data'], 'distribution': data['distribution']}
+    return render_template('analytics.html', active_page='analytics', analytics_panels=render_fragment('analytics_panels', 'fragments/analytics_panels.html', load))
 
 @app.route('/help')
 @login_required
@@ -123,10 +149,12 @@ def help_page():
 @app.route('/settings')
 @login_required
 def settings():
-    conn = get_db_connection()
-    s = {row['key']: row['value'] for row in conn.execute("SELECT * FROM settings").fetchall()}
-    conn.close()
-    return render_template('settings.html', active_page='settings', s=s)
+    def load():
+        conn = get_db_connection()
+        s = {row['key']: row['value'] for row in conn.execute("SELECT * FROM settings").fetchall()}
+        conn.close()
+        return {'s': s}
+    return render_template('settings.html', active_page='settings', settings_form=render_fragment('settings_form', 'fragments/settings_form.html', load))
 
 @app.route('/settings/update', methods=['POST'])
 @login_required
@@ -135,6 +163,8 @@ def update_settings():
     conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('plant_name', request.form['plant_name']))
     conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('threshold_eff', request.form['threshold_eff']))
     conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('shift_hours', request.form['shift_hours']))
+    record_day_sketches(conn)  # shift_hours feeds today's utilization
+    bump_data_versions(conn, ('settings', 'kpi_sketches'))
     conn.commit()
     conn.close()
     flash("System configuration updated.")
@@ -146,11 +176,15 @@ def reset_data():
     conn = get_db_connection()
     conn.execute('DELETE FROM production_logs')
     conn.execute('DELETE FROM alerts')
+    conn.execute('DELETE FROM kpi_sketches')
+    conn.execute('DELETE FROM kpi_sketch_points')
     # Re-seed logs for today only to prevent empty dash
     machines = conn.execute('SELECT id, capacity_per_hour FROM machines').fetchall()
     for m in machines:
         conn.execute("INSERT INTO production_logs (machine_id, date, planned_qty, actual_qty, runtime_hours) VALUES (?, DATE('now'), ?, 0, 0)", 
                     (m['id'], m['capacity_per_hour']*8))
+    record_day_sketches(conn)
+    bump_data_versions(conn, ('production_logs', 'alerts', 'kpi_sketches'))
     conn.commit()
     conn.close()
     flash("All historical data has been wiped.")
@@ -159,8 +193,8 @@ def reset_data():
 @app.route('/download_csv')
 @login_required
 def download_csv():
-    conn = get_db_connection()
-    logs = conn.execute('SELECT p.date, m.name, p.planned_qty, p.actual_qty FROM production_logs p JOIN machines m ON p.machine_id = m.id').fetchall()
+    with read_snapshot() as conn:
+        logs = conn.execute('SELECT p.date, m.name, p.planned_qty, p.actual_qty FROM production_logs p JOIN machines m ON p.machine_id = m.id').fetchall()
     output = io.StringIO()
     writer = csv.writer(output)
     writer.writerow(['Date', 'Machine', 'Planned', 'Actual'])
@@ -169,7 +203,16 @@ def download_csv():
 
 @app.route('/api/dashboard')
 @login_required
-def api_data(): return jsonify(calculate_kpis())
+def api_data(): return Response(calculate_kpis_json(), mimetype='application/json')
+
+@app.route('/api/percentiles')
+@login_required
+def api_percentiles():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD&scope=plant|type (defaults: today, plant-wide)
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')  # same day as SQLite's DATE('now')
+    start = request.args.get('start', today)
+    end = request.args.get('end', start)
+    return jsonify(get_percentiles(start, end, request.args.get('scope', 'plant')))
 
 @app.route('/api/simulate')
 @login_required
@@ -183,7 +226,10 @@ def simulate():
             new_qty = min(log['planned_qty'], log['actual_qty'] + random.randint(20, 100))
             new_run = min(8.0, 0.5 + (new_qty/100))
             conn.execute("UPDATE production_logs SET actual_qty = ?, runtime_hours = ? WHERE id = ?", (new_qty, round(new_run, 1), log['id']))
+    record_day_sketches(conn)
+    bump_data_versions(conn, ('production_logs', 'kpi_sketches'))
     conn.commit()
+    conn.close()
     return jsonify({"status": "ok"})
 
 if __name__ == '__main__':
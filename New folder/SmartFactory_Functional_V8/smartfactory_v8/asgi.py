@@ -0,0 +1,107 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from app import app as flask_app
+
+# ASGI entry point: `uvicorn asgi:app`
+# Idle and polling connections live on the event loop; every Flask view (and so every
+# blocking sqlite3 call in db_manager / analytics_service) runs on a bounded thread pool.
+class WsgiBridge:
+    def __init__(self, wsgi_app, workers, queue_limit, retry_after):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sf-worker')
+        self.max_pending = workers + queue_limit
+        self.retry_after = str(retry_after).encode('ascii')
+        self.pending = 0  # only touched from the event loop thread
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan': return await self.lifespan(receive, send)
+        if scope['type'] != 'http': raise RuntimeError(f"Unsupported ASGI scope: {scope['type']}")
+
+        # Load shedding: refuse straight away instead of queueing without bound
+        if self.pending >= self.max_pending: return await self.reject(send)
+
+        self.pending += 1
+        try:
+            body = await read_body(receive)
+            if body is None: return  # client went away mid-request; never dispatch a truncated body
+            loop = asyncio.get_running_loop()
+            status, headers, content = await loop.run_in_executor(self.executor, self.run_wsgi, build_environ(scope, body))
+        finally:
+            self.pending -= 1
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def run_wsgi(self, environ):
+        response, chunks = {}, []
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+            return chunks.append
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result: chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'): result.close()
+        return response['status'], response['headers'], b''.join(chunks)
+
+    async def reject(self, send):
+        await send({'type': 'http.response.start', 'status': 503, 'headers': [
+            (b'content-type', b'text/plain; charset=utf-8'), (b'retry-after', self.retry_after)]})
+        await send({'type': 'http.response.body', 'body': b'Server busy, retry shortly.'})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect': return None
+        body += message.get('body', b'')
+        if not message.get('more_body'): break
+    return body
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    # ASGI's path already includes root_path; WSGI splits it into SCRIPT_NAME + PATH_INFO
+    root_path, path = scope.get('root_path', ''), scope['path']
+    if root_path and path.startswith(root_path): path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf8').decode('latin1'),
+        'PATH_INFO': path.encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.input_terminated': True,  # body is fully buffered, so chunked requests need no Content-Length
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name == 'content-type': key = 'CONTENT_TYPE'
+        elif name == 'content-length': key = 'CONTENT_LENGTH'
+        else: key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+app = WsgiBridge(flask_app, Config.ASGI_WORKERS, Config.ASGI_QUEUE_LIMIT, Config.ASGI_RETRY_AFTER)
@@ -2,4 +2,16 @@ import os
 class Config:
     SECRET_KEY = 'v8_functional_secret'
     DB_NAME = "smartfactory_v8.db"
+    # Online-backup copy of DB_NAME for heavy analytics; refreshed every SNAPSHOT_INTERVAL seconds (0 = off)
+    SNAPSHOT_DB_NAME = "smartfactory_v8_snapshot.db"
+    SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 0))
     SHIFT_HOURS = 8.0
+    TOP_K_WORST = 5
+    # Memory budget for rendered page fragments, and an optional on-disk Jinja bytecode cache
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+    # ASGI serving (asgi.py): worker threads for blocking Flask/sqlite3 work,
+    # requests allowed to wait for a free worker, and the 503 back-off hint
+    ASGI_WORKERS = int(os.environ.get('ASGI_WORKERS', 16))
+    ASGI_QUEUE_LIMIT = int(os.environ.get('ASGI_QUEUE_LIMIT', 64))
+    ASGI_RETRY_AFTER = int(os.environ.get('ASGI_RETRY_AFTER', 2))
@@ -2,21 +2,90 @@ import sqlite3
 from config import Config
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
+from contextlib import contextmanager
+from urllib.request import pathname2url
+import logging
+import os
 import random
+import tempfile
+import threading
+import time
 
+# Writer path: every INSERT/UPDATE/DELETE goes through here
 def get_db_connection():
     conn = sqlite3.connect(Config.DB_NAME)
     conn.row_factory = sqlite3.Row
     return conn
 
+# Reader path: read-only connections that can never take the write lock
+def get_read_connection(path=None):
+    uri = f"file:{pathname2url(os.path.abspath(path or Config.DB_NAME))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+@contextmanager
+def read_snapshot(path=None):
+    # Under WAL all queries in one read transaction see the same snapshot while writers keep committing
+    conn = get_read_connection(path)
+    try:
+        conn.execute('BEGIN')
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+# Analytics snapshots: periodic online backups that heavy queries read instead of the live file
+def analytics_db_path():
+    if Config.SNAPSHOT_INTERVAL and os.path.exists(Config.SNAPSHOT_DB_NAME): return Config.SNAPSHOT_DB_NAME
+    return Config.DB_NAME
+
+def analytics_db_generation():
+    # Changes every time a refresh swaps in a new backup copy; 0 while analytics read the live file
+    path = analytics_db_path()
+    if path == Config.DB_NAME: return 0
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns)
+
+def refresh_analytics_snapshot():
+    # Each worker process runs its own refresher, so back up into a private temp file before the atomic swap
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(Config.SNAPSHOT_DB_NAME) + '.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(Config.SNAPSHOT_DB_NAME)))
+    os.close(fd)
+    try:
+        src, dst = get_read_connection(), sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+            dst.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp, Config.SNAPSHOT_DB_NAME)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+def start_snapshot_refresher(interval):
+    def refresh_loop():
+        while True:
+            try: refresh_analytics_snapshot()
+            except (sqlite3.Error, OSError): logging.getLogger(__name__).exception("Analytics snapshot refresh failed")
+            time.sleep(interval)
+    threading.Thread(target=refresh_loop, name='sf-snapshot', daemon=True).start()
+
 def init_db():
     conn = get_db_connection()
+    conn.execute('PRAGMA journal_mode = WAL')
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT, password_hash TEXT, role TEXT)')
     c.execute('CREATE TABLE IF NOT EXISTS machines (id INTEGER PRIMARY KEY, name TEXT, type TEXT, capacity_per_hour INTEGER, status TEXT DEFAULT "Active")')
     c.execute('CREATE TABLE IF NOT EXISTS production_logs (id INTEGER PRIMARY KEY, machine_id INTEGER, date TEXT, planned_qty INTEGER, actual_qty INTEGER, runtime_hours REAL)')
     c.execute('CREATE TABLE IF NOT EXISTS alerts (id INTEGER PRIMARY KEY, machine_id INTEGER, message TEXT, severity TEXT, created_at TEXT)')
     c.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
+    c.execute('CREATE TABLE IF NOT EXISTS kpi_sketches (date TEXT, scope TEXT, key TEXT, metric TEXT, digest BLOB, PRIMARY KEY (date, scope, key, metric))')
+    c.execute('CREATE TABLE IF NOT EXISTS kpi_sketch_points (date TEXT, machine_id INTEGER, type TEXT, efficiency REAL, utilization REAL)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_kpi_sketch_points_date ON kpi_sketch_points (date)')
+    c.execute('CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER)')
 
     if c.execute('SELECT count(*) FROM users').fetchone()[0] == 0:
         c.execute('INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)', ('admin', generate_password_hash('admin123'), 'admin'))
@@ -1,8 +1,105 @@
-from database.db_manager import get_db_connection
+from database.db_manager import get_read_connection, read_snapshot, analytics_db_path
+from services.sketch_service import get_percentiles
 from config import Config
+import heapq
+import threading
 
-def calculate_kpis():
-    conn = get_db_connection()
+try:
+    import orjson
+    def dumps(obj): return orjson.dumps(obj)
+except ImportError:
+    import json
+    def dumps(obj): return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+MACHINE_FIELDS = ('name', 'efficiency', 'utilization', 'idle_time', 'actual_qty', 'planned_qty', 'status')
+
+# One slotted record per machine log of the day; keeps its encoded JSON until a field changes
+class MachineKpi:
+    __slots__ = MACHINE_FIELDS + ('encoded',)
+
+    def __init__(self):
+        self.encoded = None
+
+    def values(self):
+        return (self.name, self.efficiency, self.utilization, self.idle_time, self.actual_qty, self.planned_qty, self.status)
+
+    def update(self, *values):
+        if self.encoded is not None and values == self.values(): return
+        self.name, self.efficiency, self.utilization, self.idle_time, self.actual_qty, self.planned_qty, self.status = values
+        self.encoded = None
+
+    def to_dict(self):
+        return dict(zip(MACHINE_FIELDS, self.values()))
+
+    def to_json(self):
+        if self.encoded is None: self.encoded = dumps(self.to_dict())
+        return self.encoded
+
+# Dashboard KPI state reused across recomputations, keyed by production_logs id (one row per machine per day)
+class KpiSnapshot:
+    def __init__(self):
+        self.machines = {}
+        self.order = []
+        self.summary = {}
+        self.lock = threading.Lock()
+
+    def refresh(self, rows, thresh, shift_h):
+        order = []
+        total_eff, delays = 0, 0
+        active_machines = 0
+
+        for r in rows:
+            if not r['planned_qty']: continue
+            m = self.machines.get(r['id'])
+            if m is None: m = self.machines[r['id']] = MachineKpi()
+            order.append((r['id'], m))
+
+            # Skip maintenance machines in Avg calculation if no production
+            if r['status'] == 'Maintenance' and r['actual_qty'] == 0:
+                m.update(r['name'], 0, 0, 0, 0, 0, "Maintenance")
+                continue
+
+            active_machines += 1
+            eff = round((r['actual_qty'] / r['planned_qty'] * 100), 1)
+            util = round((r['runtime_hours'] / shift_h * 100), 1)
+            idle = round(shift_h - r['runtime_hours'], 1)
+
+            status = "Good"
+            if r['status'] == 'Maintenance': status = "Maintenance"
+            elif eff < thresh: status = "Critical"
+            elif eff < (thresh + 15): status = "Warning"
+
+            if r['actual_qty'] < r['planned_qty'] and r['status'] == 'Active': delays += 1
+
+            m.update(r['name'], eff, util, idle, r['actual_qty'], r['planned_qty'], status)
+            total_eff += eff
+
+        # Drop records for logs that are gone (new day, deleted machine, data reset)
+        live = {key for key, _ in order}
+        for key in [k for k in self.machines if k not in live]: del self.machines[key]
+        self.order = [m for _, m in order]
+
+        avg = round(total_eff / active_machines, 1) if active_machines > 0 else 0
+
+        # Worst K active machines via a bounded heap; the bottleneck is the first of them
+        active_data = (m for m in self.order if m.status != 'Maintenance')
+        worst = heapq.nsmallest(Config.TOP_K_WORST, active_data, key=lambda x: x.efficiency)
+        bottle = worst[0].name if worst else "None"
+
+        self.summary = {"avg_efficiency": avg, "total_machines": len(self.order), "delayed_orders": delays, "bottleneck": bottle,
+                        "worst_machines": [{"name": m.name, "efficiency": m.efficiency} for m in worst]}
+
+    def to_dict(self):
+        return {"kpi_summary": self.summary, "machines": [m.to_dict() for m in self.order]}
+
+    def to_json(self):
+        # Only machines whose fields changed since the last call get re-encoded
+        return b''.join((b'{"kpi_summary":', dumps(self.summary), b',"machines":[', b','.join(m.to_json() for m in self.order), b']}'))
+
+kpi_snapshot = KpiSnapshot()
+
+def load_kpi_inputs():
+    conn = get_read_connection()
     rows = conn.execute("SELECT m.name, m.status, p.* FROM machines m LEFT JOIN production_logs p ON m.id = p.machine_id WHERE p.date = DATE('now')").fetchall()
     
     # Get Dynamic Settings
@@ -11,49 +108,28 @@ def calculate_kpis():
     thresh = float(settings.get('threshold_eff', 75.0))
     shift_h = float(settings.get('shift_hours', 8.0))
     
-    data = []
-    total_eff, delays = 0, 0
-    active_machines = 0
-    
-    for r in rows:
-        if not r['planned_qty']: continue
-        
-        # Skip maintenance machines in Avg calculation if no production
-        if r['status'] == 'Maintenance' and r['actual_qty'] == 0:
-            data.append({"name": r['name'], "efficiency": 0, "utilization": 0, "idle_time": 0, "actual_qty": 0, "planned_qty": 0, "status": "Maintenance"})
-            continue
-            
-        active_machines += 1
-        eff = round((r['actual_qty'] / r['planned_qty'] * 100), 1)
-        util = round((r['runtime_hours'] / shift_h * 100), 1)
-        idle = round(shift_h - r['runtime_hours'], 1)
-        
-        status = "Good"
-        if r['status'] == 'Maintenance': status = "Maintenance"
-        elif eff < thresh: status = "Critical"
-        elif eff < (thresh + 15): status = "Warning"
-        
-        if r['actual_qty'] < r['planned_qty'] and r['status'] == 'Active': delays += 1
-        
-        data.append({"name": r['name'], "efficiency": eff, "utilization": util, "idle_time": idle, "actual_qty": r['actual_qty'], "planned_qty": r['planned_qty'], "status": status})
-        total_eff += eff
-    
-    avg = round(total_eff / active_machines, 1) if active_machines > 0 else 0
-    
-    # Bottleneck is active machine with lowest efficiency
-    active_data = [d for d in data if d['status'] != 'Maintenance']
-    bottle = min(active_data, key=lambda x: x['efficiency'])['name'] if active_data else "None"
-    
     conn.close()
-    return {"kpi_summary": {"avg_efficiency": avg, "total_machines": len(data), "delayed_orders": delays, "bottleneck": bottle}, "machines": data}
+    return rows, thresh, shift_h
+
+def calculate_kpis_json():
+    rows, thresh, shift_h = load_kpi_inputs()
+    with kpi_snapshot.lock:
+        kpi_snapshot.refresh(rows, thresh, shift_h)
+        return kpi_snapshot.to_json()
 
 def get_analytics_data():
-    conn = get_db_connection()
-    rankings = conn.execute("SELECT m.name, AVG((p.actual_qty * 1.0 / p.planned_qty) * 100) as avg_eff FROM machines m JOIN production_logs p ON m.id = p.machine_id GROUP BY m.id ORDER BY avg_eff DESC").fetchall()
-    trend = conn.execute("SELECT date, AVG((actual_qty * 1.0 / planned_qty) * 100) as daily_eff FROM production_logs GROUP BY date ORDER BY date DESC LIMIT 7").fetchall()
-    conn.close()
+    # Rankings and trend come from one consistent snapshot (the backup copy when enabled)
+    with read_snapshot(analytics_db_path()) as conn:
+        rankings = conn.execute("SELECT m.name, AVG((p.actual_qty * 1.0 / p.planned_qty) * 100) as avg_eff FROM machines m JOIN production_logs p ON m.id = p.machine_id GROUP BY m.id ORDER BY avg_eff DESC").fetchall()
+        trend = conn.execute("SELECT date, AVG((actual_qty * 1.0 / planned_qty) * 100) as daily_eff FROM production_logs GROUP BY date ORDER BY date DESC LIMIT 7").fetchall()
     
     t_labels = [r['date'] for r in trend][::-1]
     t_data = [round(r['daily_eff'], 1) for r in trend][::-1]
     
-    return {"rankings": [{"name": r['name'], "avg_eff": round(r['avg_eff'], 1)} for r in rankings], "trend": {"labels": t_labels, "data": t_data}}
+    # p50/p90/p99 over the same window, merged from the daily sketches
+    distribution = {}
+    if t_labels:
+        distribution = get_percentiles(t_labels[0], t_labels[-1], 'plant')
+        distribution.update(get_percentiles(t_labels[0], t_labels[-1], 'type'))
+    
+    return {"rankings": [{"name": r['name'], "avg_eff": round(r['avg_eff'], 1)} for r in rankings], "trend": {"labels": t_labels, "data": t_data}, "distribution": distribution}
@@ -0,0 +1,68 @@
+from database.db_manager import get_read_connection, analytics_db_generation
+from config import Config
+from flask import render_template
+from markupsafe import Markup
+from collections import OrderedDict
+import threading
+
+# Tables each cached fragment is rendered from; write routes bump the tables they touch with bump_data_versions
+FRAGMENT_DEPENDENCIES = {
+    'machine_table': ('machines',),
+    'report_table': ('production_logs', 'machines'),
+    'alert_list': ('alerts', 'machines'),
+    'analytics_panels': ('production_logs', 'machines', 'kpi_sketches'),
+    'settings_form': ('settings',),
+}
+
+# Fragments rendered from analytics_db_path(); their key also tracks which backup copy they came from
+SNAPSHOT_FRAGMENTS = {'analytics_panels'}
+
+# LRU of rendered HTML with one entry per fragment name (a newer version replaces the old one),
+# bounded by the total encoded size of the cached HTML
+class FragmentCache:
+    def __init__(self, max_bytes):
+        self.entries = OrderedDict()  # name -> (version, html, size)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, name, version):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or entry[0] != version: return None
+            self.entries.move_to_end(name)
+            return entry[1]
+
+    def put(self, name, version, html):
+        size = len(html.encode('utf-8'))
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old is not None: self.size -= old[2]
+            if size > self.max_bytes: return  # too big to keep; rendered fresh every time
+            self.entries[name] = (version, html, size)
+            self.size += size
+            while self.size > self.max_bytes: self.size -= self.entries.popitem(last=False)[1][2]
+
+fragment_cache = FragmentCache(Config.FRAGMENT_CACHE_MAX_BYTES)
+
+# Versions live in the database so every worker process sees the same invalidations
+def data_versions(tables):
+    conn = get_read_connection()
+    rows = conn.execute(f"SELECT name, version FROM data_versions WHERE name IN ({','.join('?' * len(tables))})", tables).fetchall()
+    conn.close()
+    versions = {r['name']: r['version'] for r in rows}
+    return tuple(versions.get(t, 0) for t in tables)
+
+def bump_data_versions(conn, tables):
+    # Call on the writer connection before conn.commit(): the new versions land atomically with the write
+    conn.executemany("INSERT INTO data_versions (name, version) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET version = version + 1", [(t,) for t in tables])
+
+def render_fragment(name, template, load):
+    # load() runs the fragment's queries and is only called on a cache miss
+    version = data_versions(FRAGMENT_DEPENDENCIES[name])
+    if name in SNAPSHOT_FRAGMENTS: version += (analytics_db_generation(),)
+    html = fragment_cache.get(name, version)
+    if html is None:
+        html = Markup(render_template(template, **load()))
+        fragment_cache.put(name, version, html)
+    return html
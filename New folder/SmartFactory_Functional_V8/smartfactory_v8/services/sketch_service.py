@@ -0,0 +1,135 @@
+from database.db_manager import get_db_connection, read_snapshot, analytics_db_path
+from array import array
+import math
+
+METRICS = ('efficiency', 'utilization')
+PERCENTILES = (50, 90, 99)
+
+# Merging t-digest: a mergeable quantile sketch whose centroids stay small near the tails
+class TDigest:
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []  # sorted [mean, weight] pairs
+        self.buffer = []
+        self.min, self.max = math.inf, -math.inf
+
+    def add(self, value, weight=1.0):
+        self.buffer.append([value, weight])
+        self.min, self.max = min(self.min, value), max(self.max, value)
+        if len(self.buffer) > 5 * self.compression: self.compress()
+
+    def merge(self, other):
+        other.compress()
+        self.buffer.extend([m, w] for m, w in other.centroids)
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.compress()
+
+    def k_limit(self, q):
+        # Next quantile boundary under the k1 scale function k(q) = delta/(2*pi) * asin(2q - 1)
+        k = self.compression / (2 * math.pi) * math.asin(2 * q - 1) + 1
+        if k >= self.compression / 4: return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def compress(self):
+        if not self.buffer: return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = sum(w for _, w in points)
+        merged, seen = [points[0][:]], 0.0
+        q_limit = self.k_limit(0.0)
+        for mean, weight in points[1:]:
+            cur = merged[-1]
+            if (seen + cur[1] + weight) / total <= q_limit:
+                cur[0] += (mean - cur[0]) * weight / (cur[1] + weight)
+                cur[1] += weight
+            else:
+                seen += cur[1]
+                q_limit = self.k_limit(seen / total)
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        self.compress()
+        if not self.centroids: return None
+        target = q * sum(w for _, w in self.centroids)
+        prev_mean, prev_center, seen = self.min, 0.0, 0.0
+        for mean, weight in self.centroids:
+            center = seen + weight / 2
+            if target < center:
+                return prev_mean + (mean - prev_mean) * (target - prev_center) / (center - prev_center)
+            prev_mean, prev_center, seen = mean, center, seen + weight
+        return prev_mean + (self.max - prev_mean) * (target - prev_center) / (seen - prev_center)
+
+    # Persisted as packed doubles: min, max, then mean/weight pairs
+    def to_bytes(self):
+        self.compress()
+        return array('d', [self.min, self.max] + [x for c in self.centroids for x in c]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, compression=100):
+        values = array('d')
+        values.frombytes(data)
+        digest = cls(compression)
+        digest.min, digest.max = values[0], values[1]
+        digest.centroids = [[values[i], values[i + 1]] for i in range(2, len(values), 2)]
+        return digest
+
+# Ingest: freeze today's per-machine inputs (current settings and status) and rebuild today's sketches;
+# call inside the write transaction. Past days keep the inputs they were recorded with.
+def record_day_sketches(conn, date=None):
+    if date is None: date = conn.execute("SELECT DATE('now')").fetchone()[0]
+    row = conn.execute("SELECT value FROM settings WHERE key = 'shift_hours'").fetchone()
+    shift_h = float(row['value']) if row else 8.0
+    rows = conn.execute("SELECT p.machine_id, m.type, m.status, p.actual_qty, p.planned_qty, p.runtime_hours FROM production_logs p JOIN machines m ON m.id = p.machine_id WHERE p.date = ? AND p.planned_qty > 0", (date,)).fetchall()
+
+    points = []
+    for r in rows:
+        # Same exclusion as KpiSnapshot.refresh() in analytics_service: idle maintenance machines are not production data
+        if r['status'] == 'Maintenance' and r['actual_qty'] == 0: continue
+        points.append((date, r['machine_id'], r['type'], r['actual_qty'] / r['planned_qty'] * 100, (r['runtime_hours'] or 0) / shift_h * 100))
+
+    conn.execute('DELETE FROM kpi_sketch_points WHERE date = ?', (date,))
+    conn.executemany('INSERT INTO kpi_sketch_points (date, machine_id, type, efficiency, utilization) VALUES (?, ?, ?, ?, ?)', points)
+    build_day_sketches(conn, date)
+
+def build_day_sketches(conn, date):
+    digests = {}
+    for r in conn.execute('SELECT type, efficiency, utilization FROM kpi_sketch_points WHERE date = ?', (date,)).fetchall():
+        for scope, key in (('plant', 'all'), ('type', r['type'])):
+            for metric in METRICS:
+                digests.setdefault((scope, key, metric), TDigest()).add(r[metric])
+
+    conn.execute('DELETE FROM kpi_sketches WHERE date = ?', (date,))
+    conn.executemany('INSERT INTO kpi_sketches (date, scope, key, metric, digest) VALUES (?, ?, ?, ?, ?)',
+                     [(date, scope, key, metric, d.to_bytes()) for (scope, key, metric), d in digests.items()])
+
+def remove_machine_sketches(conn, machine_id):
+    # Drop only this machine's frozen inputs; every other contribution to those days stays as recorded
+    dates = [r['date'] for r in conn.execute('SELECT DISTINCT date FROM kpi_sketch_points WHERE machine_id = ?', (machine_id,)).fetchall()]
+    conn.execute('DELETE FROM kpi_sketch_points WHERE machine_id = ?', (machine_id,))
+    for date in dates: build_day_sketches(conn, date)
+
+def backfill_sketches():
+    # One-off for databases without recorded inputs: history is recorded with the settings and statuses of today
+    conn = get_db_connection()
+    if conn.execute('SELECT count(*) FROM kpi_sketch_points').fetchone()[0] == 0:
+        for r in conn.execute('SELECT DISTINCT date FROM production_logs').fetchall(): record_day_sketches(conn, r['date'])
+        conn.commit()
+    conn.close()
+
+# Query: merge the per-day sketches in [start, end] instead of scanning production_logs
+def get_percentiles(start, end, scope='plant'):
+    with read_snapshot(analytics_db_path()) as conn:
+        rows = conn.execute('SELECT key, metric, digest FROM kpi_sketches WHERE scope = ? AND date BETWEEN ? AND ?', (scope, start, end)).fetchall()
+
+    merged = {}
+    for r in rows:
+        digest = TDigest.from_bytes(r['digest'])
+        key = (r['key'], r['metric'])
+        if key in merged: merged[key].merge(digest)
+        else: merged[key] = digest
+
+    result = {}
+    for (key, metric), digest in sorted(merged.items()):
+        result.setdefault(key, {})[metric] = {f"p{p}": round(digest.quantile(p / 100), 1) for p in PERCENTILES}
+    return result
@@ -1,25 +1,41 @@
+import argparse
+import hashlib
+import io
+import json
 import os
+import sys
 import zipfile
-import io
 
 # ==========================================
 # 1. PYTHON BACKEND (Restored Logic + New Features)
 # ==========================================
 
-APP_PY = """from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash
+APP_PY = """from flask import Flask, Response, render_template, jsonify, request, redirect, url_for, session, flash
 from config import Config
-from database.db_manager import init_db, get_db_connection
-from services.analytics_service import calculate_kpis, get_analytics_data
+from database.db_manager import init_db, get_db_connection, read_snapshot, start_snapshot_refresher
+from services.analytics_service import calculate_kpis_json, get_analytics_data
+from services.sketch_service import record_day_sketches, remove_machine_sketches, backfill_sketches, get_percentiles
+from services.fragment_cache import render_fragment, bump_data_versions
+from jinja2 import FileSystemBytecodeCache
 from werkzeug.security import check_password_hash
+from datetime import datetime, timezone
 import random
 import csv
 import io
+import os
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
+# Share compiled template bytecode between workers and restarts
+if Config.TEMPLATE_CACHE_DIR:
+    os.makedirs(Config.TEMPLATE_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(Config.TEMPLATE_CACHE_DIR)
+
 with app.app_context():
     init_db()
+    backfill_sketches()
+    if Config.SNAPSHOT_INTERVAL: start_snapshot_refresher(Config.SNAPSHOT_INTERVAL)
 
 # Middleware
 def login_required(f):
@@ -58,10 +74,12 @@ def dashboard():
 @app.route('/machines')
 @login_required
 def machines():
-    conn = get_db_connection()
-    machines_list = conn.execute('SELECT * FROM machines').fetchall()
-    conn.close()
-    return render_template('machines.html', active_page='machines', machines=machines_list)
+    def load():
+        conn = get_db_connection()
+        machines_list = conn.execute('SELECT * FROM machines').fetchall()
+        conn.close()
+        return {'machines': machines_list}
+    return render_template('machines.html', active_page='machines', machine_table=render_fragment('machine_table', 'fragments/machine_table.html', load))
 
 @app.route('/machines/add', methods=['POST'])
 @login_required
@@ -75,7 +93,9 @@ def add_machine():
     mid = c.lastrowid
     c.execute("INSERT INTO production_logs (machine_id, date, planned_qty, actual_qty, runtime_hours) VALUES (?, DATE('now'), ?, 0, 0)", 
              (mid, int(request.form['capacity']) * 8)) # Default 8 hr shift plan
+    record_day_sketches(conn)
     
+    bump_data_versions(conn, ('machines', 'production_logs', 'kpi_sketches'))
     conn.commit()
     conn.close()
     flash(f"Machine {request.form['name']} added successfully!")
@@ -87,6 +107,8 @@ def delete_machine(id):
     conn = get_db_connection()
     conn.execute('DELETE FROM machines WHERE id = ?', (id,))
     conn.execute('DELETE FROM production_logs WHERE machine_id = ?', (id,))
+    remove_machine_sketches(conn, id)
+    bump_data_versions(conn, ('machines', 'production_logs', 'kpi_sketches'))
     conn.commit()
     conn.close()
     flash("Machine removed.")
@@ -99,6 +121,8 @@ def toggle_machine(id):
     curr = conn.execute("SELECT status FROM machines WHERE id=?", (id,)).fetchone()['status']
     new_status = 'Maintenance' if curr == 'Active' else 'Active'
     conn.execute("UPDATE machines SET status = ? WHERE id = ?", (new_status, id))
+    record_day_sketches(conn)
+    bump_data_versions(conn, ('machines', 'kpi_sketches'))
     conn.commit()
     conn.close()
     return redirect(url_for('machines'))
@@ -106,22 +130,28 @@ def toggle_machine(id):
 @app.route('/reports')
 @login_required
 def reports():
-    conn = get_db_connection()
-    logs = conn.execute('SELECT p.*, m.name as machine_name FROM production_logs p JOIN machines m ON p.machine_id = m.id ORDER BY p.date DESC').fetchall()
-    return render_template('reports.html', active_page='reports', logs=logs)
+    def load():
+        with read_snapshot() as conn:
+            logs = conn.execute('SELECT p.*, m.name as machine_name FROM production_logs p JOIN machines m ON p.machine_id = m.id ORDER BY p.date DESC').fetchall()
+        return {'logs': logs}
+    return render_template('reports.html', active_page='reports', report_table=render_fragment('report_table', 'fragments/report_table.html', load))
 
 @app.route('/alerts')
 @login_required
 def alerts():
-    conn = get_db_connection()
-    alerts = conn.execute('SELECT a.*, m.name as machine_name FROM alerts a JOIN machines m ON a.machine_id = m.id ORDER BY a.created_at DESC').fetchall()
-    return render_template('alerts.html', active_page='alerts', alerts=alerts, c=sum(1 for a in alerts if a['severity']=='Critical'), w=sum(1 for a in alerts if a['severity']=='Warning'), i=sum(1 for a in alerts if a['severity']=='Info'))
+    def load():
+        with read_snapshot() as conn:
+            alerts = conn.execute('SELECT a.*, m.name as machine_name FROM alerts a JOIN machines m ON a.machine_id = m.id ORDER BY a.created_at DESC').fetchall()
+        return {'alerts': alerts, 'c': sum(1 for a in alerts if a['severity']=='Critical'), 'w': sum(1 for a in alerts if a['severity']=='Warning'), 'i': sum(1 for a in alerts if a['severity']=='Info')}
+    return render_template('alerts.html', active_page='alerts', alert_list=render_fragment('alert_list', 'fragments/alert_list.html', load))
 
 @app.route('/analytics')
 @login_required
 def analytics():
-    data = get_analytics_data()
-    return render_template('analytics.html', active_page='analytics', rankings=data['rankings'], trend_labels=data['trend']['labels'], trend_data=data['trend']['data'])
+    def load():
+        data = get_analytics_data()
+        return {'rankings': data['rankings'], 'trend_labels': data['trend']['labels'], 'trend_data': data['trend']['data'], 'distribution': data['distribution']}
+    return render_template('analytics.html', active_page='analytics', analytics_panels=render_fragment('analytics_panels', 'fragments/analytics_panels.html', load))
 
 @app.route('/help')
 @login_required
@@ -131,10 +161,12 @@ def help_page():
 @app.route('/settings')
 @login_required
 def settings():
-    conn = get_db_connection()
-    s = {row['key']: row['value'] for row in conn.execute("SELECT * FROM settings").fetchall()}
-    conn.close()
-    return render_template('settings.html', active_page='settings', s=s)
+    def load():
+        conn = get_db_connection()
+        s = {row['key']: row['value'] for row in conn.execute("SELECT * FROM settings").fetchall()}
+        conn.close()
+        return {'s': s}
+    return render_template('settings.html', active_page='settings', settings_form=render_fragment('settings_form', 'fragments/settings_form.html', load))
 
 @app.route('/settings/update', methods=['POST'])
 @login_required
@@ -143,6 +175,8 @@ def update_settings():
     conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('plant_name', request.form['plant_name']))
     conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('threshold_eff', request.form['threshold_eff']))
     conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', ('shift_hours', request.form['shift_hours']))
+    record_day_sketches(conn)  # shift_hours feeds today's utilization
+    bump_data_versions(conn, ('settings', 'kpi_sketches'))
     conn.commit()
     conn.close()
     flash("System configuration updated.")
@@ -154,11 +188,15 @@ def reset_data():
     conn = get_db_connection()
     conn.execute('DELETE FROM production_logs')
     conn.execute('DELETE FROM alerts')
+    conn.execute('DELETE FROM kpi_sketches')
+    conn.execute('DELETE FROM kpi_sketch_points')
     # Re-seed logs for today only to prevent empty dash
     machines = conn.execute('SELECT id, capacity_per_hour FROM machines').fetchall()
     for m in machines:
         conn.execute("INSERT INTO production_logs (machine_id, date, planned_qty, actual_qty, runtime_hours) VALUES (?, DATE('now'), ?, 0, 0)", 
                     (m['id'], m['capacity_per_hour']*8))
+    record_day_sketches(conn)
+    bump_data_versions(conn, ('production_logs', 'alerts', 'kpi_sketches'))
     conn.commit()
     conn.close()
     flash("All historical data has been wiped.")
@@ -167,8 +205,8 @@ def reset_data():
 @app.route('/download_csv')
 @login_required
 def download_csv():
-    conn = get_db_connection()
-    logs = conn.execute('SELECT p.date, m.name, p.planned_qty, p.actual_qty FROM production_logs p JOIN machines m ON p.machine_id = m.id').fetchall()
+    with read_snapshot() as conn:
+        logs = conn.execute('SELECT p.date, m.name, p.planned_qty, p.actual_qty FROM production_logs p JOIN machines m ON p.machine_id = m.id').fetchall()
     output = io.StringIO()
     writer = csv.writer(output)
     writer.writerow(['Date', 'Machine', 'Planned', 'Actual'])
@@ -177,7 +215,16 @@ def download_csv():
 
 @app.route('/api/dashboard')
 @login_required
-def api_data(): return jsonify(calculate_kpis())
+def api_data(): return Response(calculate_kpis_json(), mimetype='application/json')
+
+@app.route('/api/percentiles')
+@login_required
+def api_percentiles():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD&scope=plant|type (defaults: today, plant-wide)
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')  # same day as SQLite's DATE('now')
+    start = request.args.get('start', today)
+    end = request.args.get('end', start)
+    return jsonify(get_percentiles(start, end, request.args.get('scope', 'plant')))
 
 @app.route('/api/simulate')
 @login_required
@@ -191,7 +238,10 @@ def simulate():
             new_qty = min(log['planned_qty'], log['actual_qty'] + random.randint(20, 100))
             new_run = min(8.0, 0.5 + (new_qty/100))
             conn.execute("UPDATE production_logs SET actual_qty = ?, runtime_hours = ? WHERE id = ?", (new_qty, round(new_run, 1), log['id']))
+    record_day_sketches(conn)
+    bump_data_versions(conn, ('production_logs', 'kpi_sketches'))
     conn.commit()
+    conn.close()
     return jsonify({"status": "ok"})
 
 if __name__ == '__main__':
@@ -247,36 +297,7 @@ MACHINES_HTML = """{% extends "base.html" %}
     <!-- LIST -->
     <div class="glass-card">
         <h3 style="margin-top:0;">Fleet Management</h3>
-        <table>
-            <thead>
-                <tr>
-                    <th>Name</th>
-                    <th>Type</th>
-                    <th>Status</th>
-                    <th>Action</th>
-                </tr>
-            </thead>
-            <tbody>
-                {% for m in machines %}
-                <tr>
-                    <td><strong>{{ m.name }}</strong></td>
-                    <td style="color:var(--text-muted);">{{ m.type }}</td>
-                    <td>
-                        <form action="{{ url_for('toggle_machine', id=m.id) }}" method="POST" style="display:inline;">
-                            <button class="status-badge {% if m.status == 'Active' %}status-Good{% else %}status-Warning{% endif %}" style="border:none; cursor:pointer;">
-                                {{ m.status }}
-                            </button>
-                        </form>
-                    </td>
-                    <td>
-                        <form action="{{ url_for('delete_machine', id=m.id) }}" method="POST">
-                            <button class="btn btn-danger" style="padding: 4px 10px; font-size:11px;">Remove</button>
-                        </form>
-                    </td>
-                </tr>
-                {% endfor %}
-            </tbody>
-        </table>
+        {{ machine_table }}
     </div>
 </div>
 {% endblock %}
@@ -300,20 +321,7 @@ SETTINGS_HTML = """{% extends "base.html" %}
 <div class="grid-2">
     <div class="glass-card">
         <h3>Performance Thresholds</h3>
-        <form action="{{ url_for('update_settings') }}" method="POST">
-            <label>Plant / Unit Name</label>
-            <input type="text" name="plant_name" value="{{ s.plant_name }}" required>
-            
-            <label>Low Efficiency Alert Threshold (%)</label>
-            <input type="number" name="threshold_eff" value="{{ s.threshold_eff }}" step="0.1" required>
-            
-            <label>Standard Shift Duration (Hours)</label>
-            <input type="number" name="shift_hours" value="{{ s.shift_hours }}" step="0.5" required>
-            
-            <button type="submit" class="btn btn-glow" style="width:100%; justify-content:center; margin-top:20px;">
-                Save Configuration
-            </button>
-        </form>
+        {{ settings_form }}
     </div>
 
     <div class="glass-card">
@@ -347,7 +355,19 @@ CONFIG_PY = """import os
 class Config:
     SECRET_KEY = 'v8_functional_secret'
     DB_NAME = "smartfactory_v8.db"
+    # Online-backup copy of DB_NAME for heavy analytics; refreshed every SNAPSHOT_INTERVAL seconds (0 = off)
+    SNAPSHOT_DB_NAME = "smartfactory_v8_snapshot.db"
+    SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 0))
     SHIFT_HOURS = 8.0
+    TOP_K_WORST = 5
+    # Memory budget for rendered page fragments, and an optional on-disk Jinja bytecode cache
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+    # ASGI serving (asgi.py): worker threads for blocking Flask/sqlite3 work,
+    # requests allowed to wait for a free worker, and the 503 back-off hint
+    ASGI_WORKERS = int(os.environ.get('ASGI_WORKERS', 16))
+    ASGI_QUEUE_LIMIT = int(os.environ.get('ASGI_QUEUE_LIMIT', 64))
+    ASGI_RETRY_AFTER = int(os.environ.get('ASGI_RETRY_AFTER', 2))
 """
 
 # DB MANAGER
@@ -355,21 +375,90 @@ DB_MANAGER_PY = """import sqlite3
 from config import Config
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
+from contextlib import contextmanager
+from urllib.request import pathname2url
+import logging
+import os
 import random
+import tempfile
+import threading
+import time
 
+# Writer path: every INSERT/UPDATE/DELETE goes through here
 def get_db_connection():
     conn = sqlite3.connect(Config.DB_NAME)
     conn.row_factory = sqlite3.Row
     return conn
 
+# Reader path: read-only connections that can never take the write lock
+def get_read_connection(path=None):
+    uri = f"file:{pathname2url(os.path.abspath(path or Config.DB_NAME))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+@contextmanager
+def read_snapshot(path=None):
+    # Under WAL all queries in one read transaction see the same snapshot while writers keep committing
+    conn = get_read_connection(path)
+    try:
+        conn.execute('BEGIN')
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+# Analytics snapshots: periodic online backups that heavy queries read instead of the live file
+def analytics_db_path():
+    if Config.SNAPSHOT_INTERVAL and os.path.exists(Config.SNAPSHOT_DB_NAME): return Config.SNAPSHOT_DB_NAME
+    return Config.DB_NAME
+
+def analytics_db_generation():
+    # Changes every time a refresh swaps in a new backup copy; 0 while analytics read the live file
+    path = analytics_db_path()
+    if path == Config.DB_NAME: return 0
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns)
+
+def refresh_analytics_snapshot():
+    # Each worker process runs its own refresher, so back up into a private temp file before the atomic swap
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(Config.SNAPSHOT_DB_NAME) + '.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(Config.SNAPSHOT_DB_NAME)))
+    os.close(fd)
+    try:
+        src, dst = get_read_connection(), sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+            dst.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp, Config.SNAPSHOT_DB_NAME)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+def start_snapshot_refresher(interval):
+    def refresh_loop():
+        while True:
+            try: refresh_analytics_snapshot()
+            except (sqlite3.Error, OSError): logging.getLogger(__name__).exception("Analytics snapshot refresh failed")
+            time.sleep(interval)
+    threading.Thread(target=refresh_loop, name='sf-snapshot', daemon=True).start()
+
 def init_db():
     conn = get_db_connection()
+    conn.execute('PRAGMA journal_mode = WAL')
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT, password_hash TEXT, role TEXT)')
     c.execute('CREATE TABLE IF NOT EXISTS machines (id INTEGER PRIMARY KEY, name TEXT, type TEXT, capacity_per_hour INTEGER, status TEXT DEFAULT "Active")')
     c.execute('CREATE TABLE IF NOT EXISTS production_logs (id INTEGER PRIMARY KEY, machine_id INTEGER, date TEXT, planned_qty INTEGER, actual_qty INTEGER, runtime_hours REAL)')
     c.execute('CREATE TABLE IF NOT EXISTS alerts (id INTEGER PRIMARY KEY, machine_id INTEGER, message TEXT, severity TEXT, created_at TEXT)')
     c.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
+    c.execute('CREATE TABLE IF NOT EXISTS kpi_sketches (date TEXT, scope TEXT, key TEXT, metric TEXT, digest BLOB, PRIMARY KEY (date, scope, key, metric))')
+    c.execute('CREATE TABLE IF NOT EXISTS kpi_sketch_points (date TEXT, machine_id INTEGER, type TEXT, efficiency REAL, utilization REAL)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_kpi_sketch_points_date ON kpi_sketch_points (date)')
+    c.execute('CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER)')
 
     if c.execute('SELECT count(*) FROM users').fetchone()[0] == 0:
         c.execute('INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)', ('admin', generate_password_hash('admin123'), 'admin'))
@@ -393,11 +482,108 @@ def init_db():
 """
 
 # ANALYTICS SERVICE
-ANALYTICS_SERVICE_PY = """from database.db_manager import get_db_connection
+ANALYTICS_SERVICE_PY = """from database.db_manager import get_read_connection, read_snapshot, analytics_db_path
+from services.sketch_service import get_percentiles
 from config import Config
+import heapq
+import threading
 
-def calculate_kpis():
-    conn = get_db_connection()
+try:
+    import orjson
+    def dumps(obj): return orjson.dumps(obj)
+except ImportError:
+    import json
+    def dumps(obj): return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+MACHINE_FIELDS = ('name', 'efficiency', 'utilization', 'idle_time', 'actual_qty', 'planned_qty', 'status')
+
+# One slotted record per machine log of the day; keeps its encoded JSON until a field changes
+class MachineKpi:
+    __slots__ = MACHINE_FIELDS + ('encoded',)
+
+    def __init__(self):
+        self.encoded = None
+
+    def values(self):
+        return (self.name, self.efficiency, self.utilization, self.idle_time, self.actual_qty, self.planned_qty, self.status)
+
+    def update(self, *values):
+        if self.encoded is not None and values == self.values(): return
+        self.name, self.efficiency, self.utilization, self.idle_time, self.actual_qty, self.planned_qty, self.status = values
+        self.encoded = None
+
+    def to_dict(self):
+        return dict(zip(MACHINE_FIELDS, self.values()))
+
+    def to_json(self):
+        if self.encoded is None: self.encoded = dumps(self.to_dict())
+        return self.encoded
+
+# Dashboard KPI state reused across recomputations, keyed by production_logs id (one row per machine per day)
+class KpiSnapshot:
+    def __init__(self):
+        self.machines = {}
+        self.order = []
+        self.summary = {}
+        self.lock = threading.Lock()
+
+    def refresh(self, rows, thresh, shift_h):
+        order = []
+        total_eff, delays = 0, 0
+        active_machines = 0
+
+        for r in rows:
+            if not r['planned_qty']: continue
+            m = self.machines.get(r['id'])
+            if m is None: m = self.machines[r['id']] = MachineKpi()
+            order.append((r['id'], m))
+
+            # Skip maintenance machines in Avg calculation if no production
+            if r['status'] == 'Maintenance' and r['actual_qty'] == 0:
+                m.update(r['name'], 0, 0, 0, 0, 0, "Maintenance")
+                continue
+
+            active_machines += 1
+            eff = round((r['actual_qty'] / r['planned_qty'] * 100), 1)
+            util = round((r['runtime_hours'] / shift_h * 100), 1)
+            idle = round(shift_h - r['runtime_hours'], 1)
+
+            status = "Good"
+            if r['status'] == 'Maintenance': status = "Maintenance"
+            elif eff < thresh: status = "Critical"
+            elif eff < (thresh + 15): status = "Warning"
+
+            if r['actual_qty'] < r['planned_qty'] and r['status'] == 'Active': delays += 1
+
+            m.update(r['name'], eff, util, idle, r['actual_qty'], r['planned_qty'], status)
+            total_eff += eff
+
+        # Drop records for logs that are gone (new day, deleted machine, data reset)
+        live = {key for key, _ in order}
+        for key in [k for k in self.machines if k not in live]: del self.machines[key]
+        self.order = [m for _, m in order]
+
+        avg = round(total_eff / active_machines, 1) if active_machines > 0 else 0
+
+        # Worst K active machines via a bounded heap; the bottleneck is the first of them
+        active_data = (m for m in self.order if m.status != 'Maintenance')
+        worst = heapq.nsmallest(Config.TOP_K_WORST, active_data, key=lambda x: x.efficiency)
+        bottle = worst[0].name if worst else "None"
+
+        self.summary = {"avg_efficiency": avg, "total_machines": len(self.order), "delayed_orders": delays, "bottleneck": bottle,
+                        "worst_machines": [{"name": m.name, "efficiency": m.efficiency} for m in worst]}
+
+    def to_dict(self):
+        return {"kpi_summary": self.summary, "machines": [m.to_dict() for m in self.order]}
+
+    def to_json(self):
+        # Only machines whose fields changed since the last call get re-encoded
+        return b''.join((b'{"kpi_summary":', dumps(self.summary), b',"machines":[', b','.join(m.to_json() for m in self.order), b']}'))
+
+kpi_snapshot = KpiSnapshot()
+
+def load_kpi_inputs():
+    conn = get_read_connection()
     rows = conn.execute("SELECT m.name, m.status, p.* FROM machines m LEFT JOIN production_logs p ON m.id = p.machine_id WHERE p.date = DATE('now')").fetchall()
     
     # Get Dynamic Settings
@@ -406,79 +592,426 @@ def calculate_kpis():
     thresh = float(settings.get('threshold_eff', 75.0))
     shift_h = float(settings.get('shift_hours', 8.0))
     
-    data = []
-    total_eff, delays = 0, 0
-    active_machines = 0
-    
-    for r in rows:
-        if not r['planned_qty']: continue
-        
-        # Skip maintenance machines in Avg calculation if no production
-        if r['status'] == 'Maintenance' and r['actual_qty'] == 0:
-            data.append({"name": r['name'], "efficiency": 0, "utilization": 0, "idle_time": 0, "actual_qty": 0, "planned_qty": 0, "status": "Maintenance"})
-            continue
-            
-        active_machines += 1
-        eff = round((r['actual_qty'] / r['planned_qty'] * 100), 1)
-        util = round((r['runtime_hours'] / shift_h * 100), 1)
-        idle = round(shift_h - r['runtime_hours'], 1)
-        
-        status = "Good"
-        if r['status'] == 'Maintenance': status = "Maintenance"
-        elif eff < thresh: status = "Critical"
-        elif eff < (thresh + 15): status = "Warning"
-        
-        if r['actual_qty'] < r['planned_qty'] and r['status'] == 'Active': delays += 1
-        
-        data.append({"name": r['name'], "efficiency": eff, "utilization": util, "idle_time": idle, "actual_qty": r['actual_qty'], "planned_qty": r['planned_qty'], "status": status})
-        total_eff += eff
-    
-    avg = round(total_eff / active_machines, 1) if active_machines > 0 else 0
-    
-    # Bottleneck is active machine with lowest efficiency
-    active_data = [d for d in data if d['status'] != 'Maintenance']
-    bottle = min(active_data, key=lambda x: x['efficiency'])['name'] if active_data else "None"
-    
     conn.close()
-    return {"kpi_summary": {"avg_efficiency": avg, "total_machines": len(data), "delayed_orders": delays, "bottleneck": bottle}, "machines": data}
+    return rows, thresh, shift_h
+
+def calculate_kpis_json():
+    rows, thresh, shift_h = load_kpi_inputs()
+    with kpi_snapshot.lock:
+        kpi_snapshot.refresh(rows, thresh, shift_h)
+        return kpi_snapshot.to_json()
 
 def get_analytics_data():
-    conn = get_db_connection()
-    rankings = conn.execute("SELECT m.name, AVG((p.actual_qty * 1.0 / p.planned_qty) * 100) as avg_eff FROM machines m JOIN production_logs p ON m.id = p.machine_id GROUP BY m.id ORDER BY avg_eff DESC").fetchall()
-    trend = conn.execute("SELECT date, AVG((actual_qty * 1.0 / planned_qty) * 100) as daily_eff FROM production_logs GROUP BY date ORDER BY date DESC LIMIT 7").fetchall()
-    conn.close()
+    # Rankings and trend come from one consistent snapshot (the backup copy when enabled)
+    with read_snapshot(analytics_db_path()) as conn:
+        rankings = conn.execute("SELECT m.name, AVG((p.actual_qty * 1.0 / p.planned_qty) * 100) as avg_eff FROM machines m JOIN production_logs p ON m.id = p.machine_id GROUP BY m.id ORDER BY avg_eff DESC").fetchall()
+        trend = conn.execute("SELECT date, AVG((actual_qty * 1.0 / planned_qty) * 100) as daily_eff FROM production_logs GROUP BY date ORDER BY date DESC LIMIT 7").fetchall()
     
     t_labels = [r['date'] for r in trend][::-1]
     t_data = [round(r['daily_eff'], 1) for r in trend][::-1]
     
-    return {"rankings": [{"name": r['name'], "avg_eff": round(r['avg_eff'], 1)} for r in rankings], "trend": {"labels": t_labels, "data": t_data}}
+    # p50/p90/p99 over the same window, merged from the daily sketches
+    distribution = {}
+    if t_labels:
+        distribution = get_percentiles(t_labels[0], t_labels[-1], 'plant')
+        distribution.update(get_percentiles(t_labels[0], t_labels[-1], 'type'))
+    
+    return {"rankings": [{"name": r['name'], "avg_eff": round(r['avg_eff'], 1)} for r in rankings], "trend": {"labels": t_labels, "data": t_data}, "distribution": distribution}
+"""
+
+SKETCH_SERVICE_PY = """from database.db_manager import get_db_connection, read_snapshot, analytics_db_path
+from array import array
+import math
+
+METRICS = ('efficiency', 'utilization')
+PERCENTILES = (50, 90, 99)
+
+# Merging t-digest: a mergeable quantile sketch whose centroids stay small near the tails
+class TDigest:
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []  # sorted [mean, weight] pairs
+        self.buffer = []
+        self.min, self.max = math.inf, -math.inf
+
+    def add(self, value, weight=1.0):
+        self.buffer.append([value, weight])
+        self.min, self.max = min(self.min, value), max(self.max, value)
+        if len(self.buffer) > 5 * self.compression: self.compress()
+
+    def merge(self, other):
+        other.compress()
+        self.buffer.extend([m, w] for m, w in other.centroids)
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.compress()
+
+    def k_limit(self, q):
+        # Next quantile boundary under the k1 scale function k(q) = delta/(2*pi) * asin(2q - 1)
+        k = self.compression / (2 * math.pi) * math.asin(2 * q - 1) + 1
+        if k >= self.compression / 4: return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def compress(self):
+        if not self.buffer: return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = sum(w for _, w in points)
+        merged, seen = [points[0][:]], 0.0
+        q_limit = self.k_limit(0.0)
+        for mean, weight in points[1:]:
+            cur = merged[-1]
+            if (seen + cur[1] + weight) / total <= q_limit:
+                cur[0] += (mean - cur[0]) * weight / (cur[1] + weight)
+                cur[1] += weight
+            else:
+                seen += cur[1]
+                q_limit = self.k_limit(seen / total)
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        self.compress()
+        if not self.centroids: return None
+        target = q * sum(w for _, w in self.centroids)
+        prev_mean, prev_center, seen = self.min, 0.0, 0.0
+        for mean, weight in self.centroids:
+            center = seen + weight / 2
+            if target < center:
+                return prev_mean + (mean - prev_mean) * (target - prev_center) / (center - prev_center)
+            prev_mean, prev_center, seen = mean, center, seen + weight
+        return prev_mean + (self.max - prev_mean) * (target - prev_center) / (seen - prev_center)
+
+    # Persisted as packed doubles: min, max, then mean/weight pairs
+    def to_bytes(self):
+        self.compress()
+        return array('d', [self.min, self.max] + [x for c in self.centroids for x in c]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, compression=100):
+        values = array('d')
+        values.frombytes(data)
+        digest = cls(compression)
+        digest.min, digest.max = values[0], values[1]
+        digest.centroids = [[values[i], values[i + 1]] for i in range(2, len(values), 2)]
+        return digest
+
+# Ingest: freeze today's per-machine inputs (current settings and status) and rebuild today's sketches;
+# call inside the write transaction. Past days keep the inputs they were recorded with.
+def record_day_sketches(conn, date=None):
+    if date is None: date = conn.execute("SELECT DATE('now')").fetchone()[0]
+    row = conn.execute("SELECT value FROM settings WHERE key = 'shift_hours'").fetchone()
+    shift_h = float(row['value']) if row else 8.0
+    rows = conn.execute("SELECT p.machine_id, m.type, m.status, p.actual_qty, p.planned_qty, p.runtime_hours FROM production_logs p JOIN machines m ON m.id = p.machine_id WHERE p.date = ? AND p.planned_qty > 0", (date,)).fetchall()
+
+    points = []
+    for r in rows:
+        # Same exclusion as KpiSnapshot.refresh() in analytics_service: idle maintenance machines are not production data
+        if r['status'] == 'Maintenance' and r['actual_qty'] == 0: continue
+        points.append((date, r['machine_id'], r['type'], r['actual_qty'] / r['planned_qty'] * 100, (r['runtime_hours'] or 0) / shift_h * 100))
+
+    conn.execute('DELETE FROM kpi_sketch_points WHERE date = ?', (date,))
+    conn.executemany('INSERT INTO kpi_sketch_points (date, machine_id, type, efficiency, utilization) VALUES (?, ?, ?, ?, ?)', points)
+    build_day_sketches(conn, date)
+
+def build_day_sketches(conn, date):
+    digests = {}
+    for r in conn.execute('SELECT type, efficiency, utilization FROM kpi_sketch_points WHERE date = ?', (date,)).fetchall():
+        for scope, key in (('plant', 'all'), ('type', r['type'])):
+            for metric in METRICS:
+                digests.setdefault((scope, key, metric), TDigest()).add(r[metric])
+
+    conn.execute('DELETE FROM kpi_sketches WHERE date = ?', (date,))
+    conn.executemany('INSERT INTO kpi_sketches (date, scope, key, metric, digest) VALUES (?, ?, ?, ?, ?)',
+                     [(date, scope, key, metric, d.to_bytes()) for (scope, key, metric), d in digests.items()])
+
+def remove_machine_sketches(conn, machine_id):
+    # Drop only this machine's frozen inputs; every other contribution to those days stays as recorded
+    dates = [r['date'] for r in conn.execute('SELECT DISTINCT date FROM kpi_sketch_points WHERE machine_id = ?', (machine_id,)).fetchall()]
+    conn.execute('DELETE FROM kpi_sketch_points WHERE machine_id = ?', (machine_id,))
+    for date in dates: build_day_sketches(conn, date)
+
+def backfill_sketches():
+    # One-off for databases without recorded inputs: history is recorded with the settings and statuses of today
+    conn = get_db_connection()
+    if conn.execute('SELECT count(*) FROM kpi_sketch_points').fetchone()[0] == 0:
+        for r in conn.execute('SELECT DISTINCT date FROM production_logs').fetchall(): record_day_sketches(conn, r['date'])
+        conn.commit()
+    conn.close()
+
+# Query: merge the per-day sketches in [start, end] instead of scanning production_logs
+def get_percentiles(start, end, scope='plant'):
+    with read_snapshot(analytics_db_path()) as conn:
+        rows = conn.execute('SELECT key, metric, digest FROM kpi_sketches WHERE scope = ? AND date BETWEEN ? AND ?', (scope, start, end)).fetchall()
+
+    merged = {}
+    for r in rows:
+        digest = TDigest.from_bytes(r['digest'])
+        key = (r['key'], r['metric'])
+        if key in merged: merged[key].merge(digest)
+        else: merged[key] = digest
+
+    result = {}
+    for (key, metric), digest in sorted(merged.items()):
+        result.setdefault(key, {})[metric] = {f"p{p}": round(digest.quantile(p / 100), 1) for p in PERCENTILES}
+    return result
+"""
+
+FRAGMENT_CACHE_PY = """from database.db_manager import get_read_connection, analytics_db_generation
+from config import Config
+from flask import render_template
+from markupsafe import Markup
+from collections import OrderedDict
+import threading
+
+# Tables each cached fragment is rendered from; write routes bump the tables they touch with bump_data_versions
+FRAGMENT_DEPENDENCIES = {
+    'machine_table': ('machines',),
+    'report_table': ('production_logs', 'machines'),
+    'alert_list': ('alerts', 'machines'),
+    'analytics_panels': ('production_logs', 'machines', 'kpi_sketches'),
+    'settings_form': ('settings',),
+}
+
+# Fragments rendered from analytics_db_path(); their key also tracks which backup copy they came from
+SNAPSHOT_FRAGMENTS = {'analytics_panels'}
+
+# LRU of rendered HTML with one entry per fragment name (a newer version replaces the old one),
+# bounded by the total encoded size of the cached HTML
+class FragmentCache:
+    def __init__(self, max_bytes):
+        self.entries = OrderedDict()  # name -> (version, html, size)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, name, version):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or entry[0] != version: return None
+            self.entries.move_to_end(name)
+            return entry[1]
+
+    def put(self, name, version, html):
+        size = len(html.encode('utf-8'))
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old is not None: self.size -= old[2]
+            if size > self.max_bytes: return  # too big to keep; rendered fresh every time
+            self.entries[name] = (version, html, size)
+            self.size += size
+            while self.size > self.max_bytes: self.size -= self.entries.popitem(last=False)[1][2]
+
+fragment_cache = FragmentCache(Config.FRAGMENT_CACHE_MAX_BYTES)
+
+# Versions live in the database so every worker process sees the same invalidations
+def data_versions(tables):
+    conn = get_read_connection()
+    rows = conn.execute(f"SELECT name, version FROM data_versions WHERE name IN ({','.join('?' * len(tables))})", tables).fetchall()
+    conn.close()
+    versions = {r['name']: r['version'] for r in rows}
+    return tuple(versions.get(t, 0) for t in tables)
+
+def bump_data_versions(conn, tables):
+    # Call on the writer connection before conn.commit(): the new versions land atomically with the write
+    conn.executemany("INSERT INTO data_versions (name, version) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET version = version + 1", [(t,) for t in tables])
+
+def render_fragment(name, template, load):
+    # load() runs the fragment's queries and is only called on a cache miss
+    version = data_versions(FRAGMENT_DEPENDENCIES[name])
+    if name in SNAPSHOT_FRAGMENTS: version += (analytics_db_generation(),)
+    html = fragment_cache.get(name, version)
+    if html is None:
+        html = Markup(render_template(template, **load()))
+        fragment_cache.put(name, version, html)
+    return html
+"""
+
+ASGI_PY = """import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from app import app as flask_app
+
+# ASGI entry point: `uvicorn asgi:app`
+# Idle and polling connections live on the event loop; every Flask view (and so every
+# blocking sqlite3 call in db_manager / analytics_service) runs on a bounded thread pool.
+class WsgiBridge:
+    def __init__(self, wsgi_app, workers, queue_limit, retry_after):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sf-worker')
+        self.max_pending = workers + queue_limit
+        self.retry_after = str(retry_after).encode('ascii')
+        self.pending = 0  # only touched from the event loop thread
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan': return await self.lifespan(receive, send)
+        if scope['type'] != 'http': raise RuntimeError(f"Unsupported ASGI scope: {scope['type']}")
+
+        # Load shedding: refuse straight away instead of queueing without bound
+        if self.pending >= self.max_pending: return await self.reject(send)
+
+        self.pending += 1
+        try:
+            body = await read_body(receive)
+            if body is None: return  # client went away mid-request; never dispatch a truncated body
+            loop = asyncio.get_running_loop()
+            status, headers, content = await loop.run_in_executor(self.executor, self.run_wsgi, build_environ(scope, body))
+        finally:
+            self.pending -= 1
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def run_wsgi(self, environ):
+        response, chunks = {}, []
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+            return chunks.append
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result: chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'): result.close()
+        return response['status'], response['headers'], b''.join(chunks)
+
+    async def reject(self, send):
+        await send({'type': 'http.response.start', 'status': 503, 'headers': [
+            (b'content-type', b'text/plain; charset=utf-8'), (b'retry-after', self.retry_after)]})
+        await send({'type': 'http.response.body', 'body': b'Server busy, retry shortly.'})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect': return None
+        body += message.get('body', b'')
+        if not message.get('more_body'): break
+    return body
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    # ASGI's path already includes root_path; WSGI splits it into SCRIPT_NAME + PATH_INFO
+    root_path, path = scope.get('root_path', ''), scope['path']
+    if root_path and path.startswith(root_path): path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf8').decode('latin1'),
+        'PATH_INFO': path.encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.input_terminated': True,  # body is fully buffered, so chunked requests need no Content-Length
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name == 'content-type': key = 'CONTENT_TYPE'
+        elif name == 'content-length': key = 'CONTENT_LENGTH'
+        else: key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+app = WsgiBridge(flask_app, Config.ASGI_WORKERS, Config.ASGI_QUEUE_LIMIT, Config.ASGI_RETRY_AFTER)
 """
 
 # HTML Files (Reused Standard ones)
 LOGIN_HTML = """<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0"><title>Login</title><link rel="stylesheet" href="{{ url_for('static', filename='css/style.css') }}"></head><body class="login-body"><div class="glow-orb orb-1"></div><div class="glow-orb orb-2"></div><div class="login-container"><div class="glass-login-card"><div class="login-header"><div class="brand-icon-large">⚡</div><h2>SmartFactory</h2><p>Industrial Intelligence Platform</p></div>{% if error %}<div class="error-banner"><span>⚠️</span> {{ error }}</div>{% endif %}<form method="POST"><div class="input-group"><label>Username</label><input type="text" name="username" placeholder="admin" required autofocus></div><div class="input-group"><label>Password</label><input type="password" name="password" placeholder="••••••••" required></div><button type="submit" class="btn btn-glow full-width">Login</button></form><div style="margin-top:30px; font-size:12px; opacity:0.6;">Restricted Access • MIDC Zone-A</div></div></div></body></html>"""
 BASE_HTML = """<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0"><title>SmartFactory V8</title><link rel="stylesheet" href="{{ url_for('static', filename='css/style.css') }}"><script src="https://cdn.jsdelivr.net/npm/chart.js"></script></head><body><div class="app-container"><aside class="sidebar"><div class="brand"><span class="brand-icon">⚡</span><h2>SmartFactory</h2></div><nav class="nav-menu"><a href="{{ url_for('dashboard') }}" class="nav-item {% if active_page == 'dashboard' %}active{% endif %}"><span>📊</span> Dashboard</a><a href="{{ url_for('machines') }}" class="nav-item {% if active_page == 'machines' %}active{% endif %}"><span>⚙️</span> Machines</a><a href="{{ url_for('reports') }}" class="nav-item {% if active_page == 'reports' %}active{% endif %}"><span>📑</span> Reports</a><a href="{{ url_for('alerts') }}" class="nav-item {% if active_page == 'alerts' %}active{% endif %}"><span>🔔</span> Alerts</a><a href="{{ url_for('analytics') }}" class="nav-item {% if active_page == 'analytics' %}active{% endif %}"><span>📈</span> Analytics</a><a href="{{ url_for('settings') }}" class="nav-item {% if active_page == 'settings' %}active{% endif %}"><span>⚙️</span> Settings</a><a href="{{ url_for('help_page') }}" class="nav-item {% if active_page == 'help' %}active{% endif %}"><span>❓</span> Help Guide</a></nav><div class="sidebar-footer"><a href="{{ url_for('logout') }}" class="logout-link"><span>🚪</span> Sign Out</a></div></aside><main class="main-content"><header class="top-bar"><div class="page-title"><h1>{% block title %}{% endblock %}</h1><p>Production Unit: Nagpur MIDC Zone-A</p></div><div class="action-area">{% block actions %}{% endblock %}</div></header><div class="content-scroll">{% block content %}{% endblock %}</div></main></div><script src="{{ url_for('static', filename='js/main.js') }}"></script>{% block scripts %}{% endblock %}</body></html>"""
 DASHBOARD_HTML = """{% extends "base.html" %}{% block title %}Dashboard{% endblock %}{% block actions %}<div class="status-badge status-Good">● Live System</div><button onclick="simulateShift()" class="btn btn-glow"><span>⚡</span> Simulate Shift</button>{% endblock %}{% block content %}<div class="grid-4"><div class="glass-card"><span class="kpi-label">Plant Efficiency</span><h2 class="kpi-value text-grad" id="kpi-eff">--%</h2></div><div class="glass-card"><span class="kpi-label">Active Machines</span><h2 class="kpi-value" id="kpi-active">--</h2></div><div class="glass-card" style="border-color: rgba(245, 158, 11, 0.3);"><span class="kpi-label" style="color: #fbbf24;">Delayed Orders</span><h2 class="kpi-value" id="kpi-delay" style="color: #fbbf24;">--</h2></div><div class="glass-card" style="border-color: rgba(239, 68, 68, 0.3);"><span class="kpi-label" style="color: #f87171;">Bottleneck</span><h2 class="kpi-value" id="kpi-bottleneck" style="color: #f87171; font-size: 24px;">--</h2></div></div><div class="grid-2"><div class="glass-card" style="height: 380px;"><span class="kpi-label">Efficiency by Machine</span><div style="height: 300px; margin-top: 15px;"><canvas id="efficiencyChart"></canvas></div></div><div class="glass-card" style="height: 380px;"><span class="kpi-label">Utilization Breakdown</span><div style="height: 300px; margin-top: 15px;"><canvas id="utilizationChart"></canvas></div></div></div><div class="table-container"><div style="display:flex; justify-content:space-between; margin-bottom: 20px;"><span class="kpi-label">Live Production Status</span><span class="kpi-label">Updates every 5s</span></div><table><thead><tr><th>Machine Name</th><th>Status</th><th>Progress (Act/Plan)</th><th>Efficiency</th><th>Idle Time</th></tr></thead><tbody id="dashboard-table"></tbody></table></div>{% endblock %}{% block scripts %}<script src="{{ url_for('static', filename='js/dashboard.js') }}"></script>{% endblock %}"""
-REPORTS_HTML = """{% extends "base.html" %}{% block title %}Production Reports{% endblock %}{% block content %}<div class="glass-card"><div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:20px;"><span class="kpi-label">Production Logs</span><a href="{{ url_for('download_csv') }}" class="btn btn-glow" style="padding: 8px 16px; font-size:12px; text-decoration:none;">Download CSV Report</a></div><table><thead><tr><th>Date</th><th>Machine</th><th>Planned</th><th>Actual</th><th>Runtime</th><th>Performance</th></tr></thead><tbody>{% for log in logs %}<tr><td style="color:var(--text-muted);">{{ log.date }}</td><td><strong>{{ log.machine_name }}</strong></td><td>{{ log.planned_qty }}</td><td>{{ log.actual_qty }}</td><td>{{ log.runtime_hours }} hrs</td><td>{% set eff = (log.actual_qty / log.planned_qty * 100)|round(1) if log.planned_qty > 0 else 0 %}<span class="status-badge {% if eff < 75 %}status-Critical{% else %}status-Good{% endif %}">{{ eff }}%</span></td></tr>{% endfor %}</tbody></table></div>{% endblock %}"""
-ALERTS_HTML = """{% extends "base.html" %}{% block title %}System Alerts{% endblock %}{% block actions %}<button class="btn btn-glow" onclick="window.location.reload()">Refresh Stream</button>{% endblock %}{% block content %}<div class="grid-3"><div class="alert-card alert-critical"><div class="alert-icon">🚨</div><div><h4>Critical</h4><p class="alert-count">{{ c }}</p></div></div><div class="alert-card alert-warning"><div class="alert-icon">⚠️</div><div><h4>Warnings</h4><p class="alert-count">{{ w }}</p></div></div><div class="alert-card alert-info"><div class="alert-icon">ℹ️</div><div><h4>Info</h4><p class="alert-count">{{ i }}</p></div></div></div><div class="glass-card" style="margin-top: 24px;"><h3>Alert History</h3><div class="alert-list">{% for alert in alerts %}<div class="alert-item alert-{{ alert.severity }}" style="background: rgba(255,255,255,0.02); border-left: 4px solid; padding: 16px; border-radius: 8px; margin-bottom: 10px; border-color: {% if alert.severity == 'Critical' %}#ef4444{% elif alert.severity == 'Warning' %}#f59e0b{% else %}#6366f1{% endif %};"><div style="font-size:11px; color:#94a3b8; margin-bottom:5px;">{{ alert.created_at }}</div><div style="font-size:14px; margin-bottom:5px;">{{ alert.message }}</div><div style="font-size:12px; color:#94a3b8;">Source: {{ alert.machine_name }}</div></div>{% endfor %}</div></div>{% endblock %}"""
-ANALYTICS_HTML = """{% extends "base.html" %}{% block title %}Performance Analytics{% endblock %}{% block content %}<div class="glass-card" style="height: 400px; margin-bottom: 24px;"><span class="kpi-label">7-Day Plant Efficiency Trend</span><div style="height: 320px; margin-top: 15px;"><canvas id="trendChart"></canvas></div></div><div class="grid-2"><div class="glass-card"><h3>Machine Rankings (All Time)</h3><table><thead><tr><th>Rank</th><th>Machine</th><th>Avg Efficiency</th><th>Performance Bar</th></tr></thead><tbody>{% for m in rankings %}<tr><td><strong>#{{ loop.index }}</strong></td><td>{{ m.name }}</td><td>{{ m.avg_eff }}%</td><td style="width:40%;"><div class="progress-bar"><div class="progress-fill" style="width: {{ m.avg_eff }}%; background: {% if m.avg_eff >= 90 %}#10b981{% elif m.avg_eff >= 75 %}#fbbf24{% else %}#ef4444{% endif %};"></div></div></td></tr>{% endfor %}</tbody></table></div><div class="glass-card"><h3>Downtime Distribution</h3><div style="height: 250px;"><canvas id="downtimeChart"></canvas></div></div></div><script>document.addEventListener('DOMContentLoaded', () => { new Chart(document.getElementById('trendChart'), { type: 'line', data: { labels: {{ trend_labels | tojson }}, datasets: [{ label: 'Avg Efficiency (%)', data: {{ trend_data | tojson }}, borderColor: '#6366f1', backgroundColor: 'rgba(99, 102, 241, 0.1)', fill: true, tension: 0.4 }] }, options: { responsive: true, maintainAspectRatio: false, scales: { y: { beginAtZero: true, max: 100 } } } }); new Chart(document.getElementById('downtimeChart'), { type: 'pie', data: { labels: ['Maintenance', 'Material Shortage', 'Operator Unavailable', 'Setup Time'], datasets: [{ data: [30, 25, 15, 30], backgroundColor: ['#ef4444', '#f59e0b', '#6366f1', '#10b981'], borderWidth: 0 }] }, options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { position: 'right' } } } }); });</script>{% endblock %}"""
+REPORTS_HTML = """{% extends "base.html" %}{% block title %}Production Reports{% endblock %}{% block content %}<div class="glass-card"><div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:20px;"><span class="kpi-label">Production Logs</span><a href="{{ url_for('download_csv') }}" class="btn btn-glow" style="padding: 8px 16px; font-size:12px; text-decoration:none;">Download CSV Report</a></div>{{ report_table }}</div>{% endblock %}"""
+ALERTS_HTML = """{% extends "base.html" %}{% block title %}System Alerts{% endblock %}{% block actions %}<button class="btn btn-glow" onclick="window.location.reload()">Refresh Stream</button>{% endblock %}{% block content %}{{ alert_list }}{% endblock %}"""
+ANALYTICS_HTML = """{% extends "base.html" %}{% block title %}Performance Analytics{% endblock %}{% block content %}{{ analytics_panels }}{% endblock %}"""
 HELP_HTML = """{% extends "base.html" %}{% block title %}User Guide{% endblock %}{% block content %}<div class="grid-2"><div class="glass-card"><h3>🚀 Getting Started</h3><p style="color:#94a3b8; font-size:14px; line-height:1.6;">Welcome to SmartFactory. This system is designed to help MSMEs track production efficiency in real-time.<br><br><strong>Default Logins:</strong><br>• Admin: <code>admin</code> / <code>admin123</code><br>• Operator: <code>operator</code> / <code>operator123</code></p></div><div class="glass-card"><h3>📊 Understanding KPIs</h3><ul style="color:#94a3b8; font-size:14px; line-height:1.8; padding-left:20px;"><li><strong>Efficiency:</strong> (Actual Output / Planned Output) × 100</li><li><strong>Utilization:</strong> (Runtime Hours / 8 Hour Shift) × 100</li><li><strong>Bottleneck:</strong> The machine with the lowest efficiency.</li><li><strong>Status Colors:</strong> <span style="color:#10b981">Green (>75%)</span>, <span style="color:#ef4444">Red (<75%)</span>.</li></ul></div></div>{% endblock %}"""
+MACHINE_TABLE_HTML = """<table>
+    <thead>
+        <tr>
+            <th>Name</th>
+            <th>Type</th>
+            <th>Status</th>
+            <th>Action</th>
+        </tr>
+    </thead>
+    <tbody>
+        {% for m in machines %}
+        <tr>
+            <td><strong>{{ m.name }}</strong></td>
+            <td style="color:var(--text-muted);">{{ m.type }}</td>
+            <td>
+                <form action="{{ url_for('toggle_machine', id=m.id) }}" method="POST" style="display:inline;">
+                    <button class="status-badge {% if m.status == 'Active' %}status-Good{% else %}status-Warning{% endif %}" style="border:none; cursor:pointer;">
+                        {{ m.status }}
+                    </button>
+                </form>
+            </td>
+            <td>
+                <form action="{{ url_for('delete_machine', id=m.id) }}" method="POST">
+                    <button class="btn btn-danger" style="padding: 4px 10px; font-size:11px;">Remove</button>
+                </form>
+            </td>
+        </tr>
+        {% endfor %}
+    </tbody>
+</table>
+"""
+SETTINGS_FORM_HTML = """<form action="{{ url_for('update_settings') }}" method="POST">
+    <label>Plant / Unit Name</label>
+    <input type="text" name="plant_name" value="{{ s.plant_name }}" required>
+    
+    <label>Low Efficiency Alert Threshold (%)</label>
+    <input type="number" name="threshold_eff" value="{{ s.threshold_eff }}" step="0.1" required>
+    
+    <label>Standard Shift Duration (Hours)</label>
+    <input type="number" name="shift_hours" value="{{ s.shift_hours }}" step="0.5" required>
+    
+    <button type="submit" class="btn btn-glow" style="width:100%; justify-content:center; margin-top:20px;">
+        Save Configuration
+    </button>
+</form>
+"""
+REPORT_TABLE_HTML = """<table><thead><tr><th>Date</th><th>Machine</th><th>Planned</th><th>Actual</th><th>Runtime</th><th>Performance</th></tr></thead><tbody>{% for log in logs %}<tr><td style="color:var(--text-muted);">{{ log.date }}</td><td><strong>{{ log.machine_name }}</strong></td><td>{{ log.planned_qty }}</td><td>{{ log.actual_qty }}</td><td>{{ log.runtime_hours }} hrs</td><td>{% set eff = (log.actual_qty / log.planned_qty * 100)|round(1) if log.planned_qty > 0 else 0 %}<span class="status-badge {% if eff < 75 %}status-Critical{% else %}status-Good{% endif %}">{{ eff }}%</span></td></tr>{% endfor %}</tbody></table>"""
+ALERT_LIST_HTML = """<div class="grid-3"><div class="alert-card alert-critical"><div class="alert-icon">🚨</div><div><h4>Critical</h4><p class="alert-count">{{ c }}</p></div></div><div class="alert-card alert-warning"><div class="alert-icon">⚠️</div><div><h4>Warnings</h4><p class="alert-count">{{ w }}</p></div></div><div class="alert-card alert-info"><div class="alert-icon">ℹ️</div><div><h4>Info</h4><p class="alert-count">{{ i }}</p></div></div></div><div class="glass-card" style="margin-top: 24px;"><h3>Alert History</h3><div class="alert-list">{% for alert in alerts %}<div class="alert-item alert-{{ alert.severity }}" style="background: rgba(255,255,255,0.02); border-left: 4px solid; padding: 16px; border-radius: 8px; margin-bottom: 10px; border-color: {% if alert.severity == 'Critical' %}#ef4444{% elif alert.severity == 'Warning' %}#f59e0b{% else %}#6366f1{% endif %};"><div style="font-size:11px; color:#94a3b8; margin-bottom:5px;">{{ alert.created_at }}</div><div style="font-size:14px; margin-bottom:5px;">{{ alert.message }}</div><div style="font-size:12px; color:#94a3b8;">Source: {{ alert.machine_name }}</div></div>{% endfor %}</div></div>"""
+ANALYTICS_PANELS_HTML = """<div class="glass-card" style="height: 400px; margin-bottom: 24px;"><span class="kpi-label">7-Day Plant Efficiency Trend</span><div style="height: 320px; margin-top: 15px;"><canvas id="trendChart"></canvas></div></div><div class="grid-2"><div class="glass-card"><h3>Machine Rankings (All Time)</h3><table><thead><tr><th>Rank</th><th>Machine</th><th>Avg Efficiency</th><th>Performance Bar</th></tr></thead><tbody>{% for m in rankings %}<tr><td><strong>#{{ loop.index }}</strong></td><td>{{ m.name }}</td><td>{{ m.avg_eff }}%</td><td style="width:40%;"><div class="progress-bar"><div class="progress-fill" style="width: {{ m.avg_eff }}%; background: {% if m.avg_eff >= 90 %}#10b981{% elif m.avg_eff >= 75 %}#fbbf24{% else %}#ef4444{% endif %};"></div></div></td></tr>{% endfor %}</tbody></table></div><div class="glass-card"><h3>Downtime Distribution</h3><div style="height: 250px;"><canvas id="downtimeChart"></canvas></div></div></div><div class="glass-card"><h3>Efficiency &amp; Utilization Distribution (7 Days)</h3><table><thead><tr><th>Scope</th><th>Eff p50</th><th>Eff p90</th><th>Eff p99</th><th>Util p50</th><th>Util p90</th><th>Util p99</th></tr></thead><tbody>{% for key, d in distribution.items() %}<tr><td><strong>{{ 'Plant' if key == 'all' else key }}</strong></td><td>{{ d.efficiency.p50 }}%</td><td>{{ d.efficiency.p90 }}%</td><td>{{ d.efficiency.p99 }}%</td><td>{{ d.utilization.p50 }}%</td><td>{{ d.utilization.p90 }}%</td><td>{{ d.utilization.p99 }}%</td></tr>{% endfor %}</tbody></table></div><script>document.addEventListener('DOMContentLoaded', () => { new Chart(document.getElementById('trendChart'), { type: 'line', data: { labels: {{ trend_labels | tojson }}, datasets: [{ label: 'Avg Efficiency (%)', data: {{ trend_data | tojson }}, borderColor: '#6366f1', backgroundColor: 'rgba(99, 102, 241, 0.1)', fill: true, tension: 0.4 }] }, options: { responsive: true, maintainAspectRatio: false, scales: { y: { beginAtZero: true, max: 100 } } } }); new Chart(document.getElementById('downtimeChart'), { type: 'pie', data: { labels: ['Maintenance', 'Material Shortage', 'Operator Unavailable', 'Setup Time'], datasets: [{ data: [30, 25, 15, 30], backgroundColor: ['#ef4444', '#f59e0b', '#6366f1', '#10b981'], borderWidth: 0 }] }, options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { position: 'right' } } } }); });</script>"""
 
 STYLE_CSS = """@import url('https://fonts.googleapis.com/css2?family=Outfit:wght@300;400;500;600;700&display=swap'); :root { --primary: #6366f1; --primary-dark: #4f46e5; --secondary: #8b5cf6; --bg-dark: #0f172a; --bg-panel: #1e293b; --text-main: #f8fafc; --text-muted: #94a3b8; --success: #10b981; --warning: #f59e0b; --danger: #ef4444; --border: rgba(255, 255, 255, 0.08); } * { box-sizing: border-box; transition: all 0.2s ease-in-out; } body { margin: 0; font-family: 'Outfit', sans-serif; background-color: var(--bg-dark); color: var(--text-main); height: 100vh; overflow: hidden; } .app-container { display: flex; height: 100%; } .sidebar { width: 280px; background: var(--bg-panel); border-right: 1px solid var(--border); display: flex; flex-direction: column; padding: 24px; } .brand { display: flex; align-items: center; gap: 12px; margin-bottom: 40px; padding-left: 10px; } .brand-icon { font-size: 24px; background: linear-gradient(135deg, var(--primary), var(--secondary)); -webkit-background-clip: text; -webkit-text-fill-color: transparent; } .brand h2 { margin: 0; font-size: 20px; } .nav-menu { flex: 1; display: flex; flex-direction: column; gap: 8px; } .nav-item { display: flex; align-items: center; gap: 14px; padding: 14px 18px; border-radius: 12px; color: var(--text-muted); text-decoration: none; font-weight: 500; } .nav-item:hover { background: rgba(255,255,255,0.03); color: var(--text-main); transform: translateX(5px); } .nav-item.active { background: linear-gradient(90deg, rgba(99, 102, 241, 0.15), transparent); color: var(--primary); border-left: 3px solid var(--primary); } .sidebar-footer { margin-top: auto; padding-top: 20px; border-top: 1px solid var(--border); } .logout-link { display: flex; align-items: center; gap: 10px; color: var(--danger); text-decoration: none; font-size: 14px; font-weight: 500; padding: 10px; border-radius: 8px; } .logout-link:hover { background: rgba(239, 68, 68, 0.1); } .main-content { flex: 1; display: flex; flex-direction: column; overflow: hidden; } .top-bar { padding: 24px 32px; display: flex; justify-content: space-between; align-items: center; background: rgba(15, 23, 42, 0.8); backdrop-filter: blur(10px); border-bottom: 1px solid var(--border); z-index: 10; } .page-title h1 { margin: 0; font-size: 24px; font-weight: 600; } .page-title p { margin: 4px 0 0 0; color: var(--text-muted); font-size: 13px; } .action-area { display: flex; align-items: center; gap: 16px; } .btn { padding: 10px 20px; border-radius: 10px; border: none; font-weight: 600; cursor: pointer; font-family: 'Outfit', sans-serif; display: flex; align-items: center; gap: 8px; } .btn-glow { background: linear-gradient(135deg, var(--primary), var(--secondary)); color: white; box-shadow: 0 4px 15px rgba(99, 102, 241, 0.3); } .btn-glow:hover { box-shadow: 0 6px 20px rgba(99, 102, 241, 0.5); transform: translateY(-1px); } .btn-danger { background: rgba(239, 68, 68, 0.1); color: var(--danger); border: 1px solid rgba(239, 68, 68, 0.2); } .content-scroll { padding: 32px; overflow-y: auto; flex: 1; } .grid-4 { display: grid; grid-template-columns: repeat(4, 1fr); gap: 24px; margin-bottom: 32px; } .grid-3 { display: grid; grid-template-columns: repeat(3, 1fr); gap: 24px; margin-bottom: 32px; } .grid-2 { display: grid; grid-template-columns: 1fr 1fr; gap: 24px; margin-bottom: 32px; } .glass-card { background: var(--bg-panel); border: 1px solid var(--border); border-radius: 16px; padding: 24px; position: relative; overflow: hidden; } .glass-card::before { content: ''; position: absolute; top: 0; left: 0; width: 100%; height: 4px; background: linear-gradient(90deg, var(--primary), transparent); opacity: 0.5; } .kpi-label { font-size: 12px; text-transform: uppercase; letter-spacing: 1px; color: var(--text-muted); margin-bottom: 8px; display: block; } .kpi-value { font-size: 32px; font-weight: 700; margin: 0; color: white; } .text-grad { background: linear-gradient(to right, #fff, #94a3b8); -webkit-background-clip: text; -webkit-text-fill-color: transparent; } .table-container { background: var(--bg-panel); border-radius: 16px; padding: 20px; border: 1px solid var(--border); } table { width: 100%; border-collapse: separate; border-spacing: 0 8px; } th { text-align: left; padding: 12px 16px; color: var(--text-muted); font-size: 12px; text-transform: uppercase; letter-spacing: 0.5px; } td { background: rgba(255,255,255,0.02); padding: 16px; font-size: 14px; border-top: 1px solid var(--border); border-bottom: 1px solid var(--border); } td:first-child { border-left: 1px solid var(--border); border-top-left-radius: 8px; border-bottom-left-radius: 8px; } td:last-child { border-right: 1px solid var(--border); border-top-right-radius: 8px; border-bottom-right-radius: 8px; } .status-badge { padding: 4px 12px; border-radius: 20px; font-size: 12px; font-weight: 600; } .status-Good { background: rgba(16, 185, 129, 0.15); color: #34d399; border: 1px solid rgba(16, 185, 129, 0.2); } .status-Warning { background: rgba(245, 158, 11, 0.15); color: #fbbf24; border: 1px solid rgba(245, 158, 11, 0.2); } .status-Critical { background: rgba(239, 68, 68, 0.15); color: #f87171; border: 1px solid rgba(239, 68, 68, 0.2); } .login-body { display: flex; justify-content: center; align-items: center; background: radial-gradient(circle at top right, #1e1b4b, #0f172a); position: relative; } .login-container { width: 100%; max-width: 400px; padding: 20px; z-index: 10; } .glass-login-card { background: rgba(30, 41, 59, 0.6); backdrop-filter: blur(20px); border: 1px solid rgba(255, 255, 255, 0.1); padding: 40px; border-radius: 24px; box-shadow: 0 25px 50px -12px rgba(0, 0, 0, 0.5); text-align: center; } .login-header { margin-bottom: 30px; } .brand-icon-large { font-size: 48px; margin-bottom: 10px; display: inline-block; background: linear-gradient(135deg, var(--primary), var(--secondary)); -webkit-background-clip: text; -webkit-text-fill-color: transparent; } .input-group { text-align: left; margin-bottom: 20px; } .input-group label { margin-bottom: 8px; display: block; font-size: 12px; text-transform: uppercase; color: var(--text-muted); } .input-group input, select { width:100%; padding:12px; background: rgba(15, 23, 42, 0.6); border: 1px solid var(--border); font-size: 16px; transition: 0.3s; color: white; border-radius:8px; } .input-group input:focus { border-color: var(--primary); box-shadow: 0 0 0 4px rgba(99, 102, 241, 0.1); background: rgba(15, 23, 42, 0.8); outline:none; } .full-width { width: 100%; justify-content: center; padding: 14px; font-size: 16px; margin-top: 10px; } .error-banner { background: rgba(239, 68, 68, 0.1); color: #fca5a5; padding: 12px; border-radius: 8px; font-size: 13px; margin-bottom: 20px; border: 1px solid rgba(239, 68, 68, 0.2); } .glow-orb { position: absolute; border-radius: 50%; filter: blur(80px); opacity: 0.4; z-index: 1; } .orb-1 { width: 300px; height: 300px; background: var(--primary); top: -50px; left: -50px; } .orb-2 { width: 400px; height: 400px; background: var(--secondary); bottom: -100px; right: -100px; } .alert-card { background: var(--bg-panel); border-radius: 12px; padding: 20px; display: flex; align-items: center; gap: 16px; border: 1px solid var(--border); } .alert-card.alert-critical { border-color: rgba(239, 68, 68, 0.3); } .alert-card.alert-warning { border-color: rgba(245, 158, 11, 0.3); } .alert-card.alert-info { border-color: rgba(99, 102, 241, 0.3); } .alert-icon { font-size: 32px; } .alert-count { font-size: 32px; font-weight: 700; margin: 5px 0 0 0; } .progress-bar { width: 100%; height: 8px; background: rgba(255,255,255,0.05); border-radius: 4px; overflow: hidden; } .progress-fill { height: 100%; border-radius: 4px; transition: width 0.3s; } @media (max-width: 1024px) { .grid-4, .grid-3 { grid-template-columns: 1fr 1fr; } .grid-2 { grid-template-columns: 1fr; } }"""
 DASHBOARD_JS = """document.addEventListener('DOMContentLoaded', () => { fetchData(); setInterval(fetchData, 5000); Chart.defaults.color = '#94a3b8'; Chart.defaults.borderColor = 'rgba(255,255,255,0.05)'; }); let charts = {}; function fetchData() { fetch('/api/dashboard').then(r => r.json()).then(updateUI); } function simulateShift() { const btn = document.querySelector('.btn-glow'); btn.innerHTML = '<span>⚙️</span> Processing...'; fetch('/api/simulate').then(() => { fetchData(); setTimeout(() => btn.innerHTML = '<span>⚡</span> Simulate Shift', 500); }); } function updateUI(data) { const s = data.kpi_summary; document.getElementById('kpi-eff').textContent = s.avg_efficiency + '%'; document.getElementById('kpi-active').textContent = s.total_machines; document.getElementById('kpi-delay').textContent = s.delayed_orders; document.getElementById('kpi-bottleneck').textContent = s.bottleneck; const tbody = document.getElementById('dashboard-table'); tbody.innerHTML = ''; data.machines.forEach(m => { tbody.innerHTML += `<tr><td><strong>${m.name}</strong></td><td><span class="status-badge status-${m.status}">${m.status}</span></td><td><div style="display:flex; align-items:center; gap:8px;"><span style="font-size:12px; width:60px;">${m.actual_qty} / ${m.planned_qty}</span><div style="flex:1; height:4px; background:rgba(255,255,255,0.1); border-radius:2px;"><div style="width:${Math.min((m.actual_qty/m.planned_qty)*100, 100)}%; height:100%; background:${m.status === 'Critical' ? '#ef4444' : '#10b981'}; border-radius:2px;"></div></div></div></td><td><strong style="color:${m.status === 'Critical' ? '#ef4444' : '#10b981'}">${m.efficiency}%</strong></td><td>${m.idle_time}h</td></tr>`; }); updateCharts(data.machines); } function updateCharts(machines) { const labels = machines.map(m => m.name); if (charts.eff) charts.eff.destroy(); charts.eff = new Chart(document.getElementById('efficiencyChart'), { type: 'bar', data: { labels: labels, datasets: [{ label: 'Efficiency %', data: machines.map(m => m.efficiency), backgroundColor: machines.map(m => m.efficiency < 75 ? '#ef4444' : '#6366f1'), borderRadius: 4, barThickness: 30 }] }, options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { display: false } }, scales: { y: { beginAtZero: true, grid: { display: true, color: 'rgba(255,255,255,0.05)' } } } } }); if (charts.util) charts.util.destroy(); charts.util = new Chart(document.getElementById('utilizationChart'), { type: 'doughnut', data: { labels: labels, datasets: [{ data: machines.map(m => m.utilization), backgroundColor: ['#6366f1', '#8b5cf6', '#ec4899', '#10b981'], borderWidth: 0 }] }, options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { position: 'bottom', labels: { usePointStyle: true, padding: 20 } } }, cutout: '75%' } }); }"""
 MAIN_JS = "console.log('SmartFactory V8 Loaded');"
 
 # ==========================================
-# 4. ZIP BUILDER
+# 4. ARCHIVE STRUCTURE
 # ==========================================
 
 structure = {
-    'smartfactory_v8/requirements.txt': "Flask==3.0.0\nWerkzeug==3.0.0",
+    'smartfactory_v8/requirements.txt': "Flask==3.0.0\nWerkzeug==3.0.0\nuvicorn==0.30.0",
     'smartfactory_v8/config.py': CONFIG_PY,
     'smartfactory_v8/app.py': APP_PY,
+    'smartfactory_v8/asgi.py': ASGI_PY,
     'smartfactory_v8/database/__init__.py': "",
     'smartfactory_v8/database/db_manager.py': DB_MANAGER_PY,
     'smartfactory_v8/services/__init__.py': "",
     'smartfactory_v8/services/analytics_service.py': ANALYTICS_SERVICE_PY,
+    'smartfactory_v8/services/sketch_service.py': SKETCH_SERVICE_PY,
+    'smartfactory_v8/services/fragment_cache.py': FRAGMENT_CACHE_PY,
     'smartfactory_v8/templates/login.html': LOGIN_HTML,
     'smartfactory_v8/templates/base.html': BASE_HTML,
     'smartfactory_v8/templates/dashboard.html': DASHBOARD_HTML,
@@ -488,17 +1021,99 @@ structure = {
     'smartfactory_v8/templates/analytics.html': ANALYTICS_HTML,
     'smartfactory_v8/templates/help.html': HELP_HTML,
     'smartfactory_v8/templates/settings.html': SETTINGS_HTML,
+    'smartfactory_v8/templates/fragments/machine_table.html': MACHINE_TABLE_HTML,
+    'smartfactory_v8/templates/fragments/settings_form.html': SETTINGS_FORM_HTML,
+    'smartfactory_v8/templates/fragments/report_table.html': REPORT_TABLE_HTML,
+    'smartfactory_v8/templates/fragments/alert_list.html': ALERT_LIST_HTML,
+    'smartfactory_v8/templates/fragments/analytics_panels.html': ANALYTICS_PANELS_HTML,
     'smartfactory_v8/static/css/style.css': STYLE_CSS,
     'smartfactory_v8/static/js/main.js': MAIN_JS,
     'smartfactory_v8/static/js/dashboard.js': DASHBOARD_JS,
 }
 
-zip_buffer = io.BytesIO()
-with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-    for file_path, content in structure.items():
-        zip_file.writestr(file_path, content)
+# ==========================================
+# 5. INCREMENTAL BUILD
+# ==========================================
+
+ZIP_NAME = "SmartFactory_Functional_V8.zip"
+MANIFEST_NAME = "SmartFactory_Functional_V8.manifest.json"
+BUILD_FORMAT = 1  # bump when the archive layout changes so old manifests are ignored
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)  # fixed timestamp -> byte-reproducible archives
+EXIT_UP_TO_DATE = 3  # --exit-code status when nothing changed (1 and 2 stay free for errors/usage)
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def encode_structure():
+    return {path: content.encode('utf-8') for path, content in sorted(structure.items())}
 
-with open("SmartFactory_Functional_V8.zip", "wb") as f:
-    f.write(zip_buffer.getvalue())
+def load_manifest():
+    try:
+        with open(MANIFEST_NAME, encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-print("✅ SUCCESS: 'SmartFactory_Functional_V8.zip' created!")
+def build_zip(files):
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for file_path, data in files.items():
+            info = zipfile.ZipInfo(file_path, date_time=ZIP_EPOCH)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 3
+            info.external_attr = 0o100644 << 16
+            zip_file.writestr(info, data)
+    return zip_buffer.getvalue()
+
+def write_unpacked(root, files, old_hashes):
+    # Only touch files whose bytes on disk differ; drop files that left the structure
+    written = 0
+    for file_path, data in files.items():
+        target = os.path.join(root, file_path)
+        if os.path.exists(target):
+            with open(target, 'rb') as f:
+                if f.read() == data: continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f: f.write(data)
+        written += 1
+    for file_path in set(old_hashes) - set(files):
+        target = os.path.join(root, file_path)
+        if os.path.exists(target): os.remove(target)
+    return written
+
+def build(unpack_dir=None, force=False):
+    files = encode_structure()
+    hashes = {file_path: sha256(data) for file_path, data in files.items()}
+    old = load_manifest()
+    old_hashes = old.get('files', {}) if old.get('format') == BUILD_FORMAT else {}
+
+    archive_ok = False
+    if os.path.exists(ZIP_NAME):
+        with open(ZIP_NAME, 'rb') as f: archive_ok = sha256(f.read()) == old.get('archive')
+
+    if unpack_dir:
+        written = write_unpacked(unpack_dir, files, old_hashes)
+        print(f"📂 Unpacked tree '{unpack_dir}': {written} file(s) written.")
+
+    if not force and archive_ok and hashes == old_hashes:
+        print(f"✅ UP TO DATE: '{ZIP_NAME}' unchanged, nothing to deploy.")
+        return False
+
+    changed = [p for p in hashes if old_hashes.get(p) != hashes[p]]
+    archive = build_zip(files)
+    with open(ZIP_NAME, "wb") as f:
+        f.write(archive)
+    with open(MANIFEST_NAME, "w", encoding='utf-8', newline='\n') as f:
+        json.dump({'format': BUILD_FORMAT, 'archive': sha256(archive), 'files': hashes}, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f"✅ SUCCESS: '{ZIP_NAME}' created! ({len(changed)} of {len(files)} file(s) changed)")
+    return True
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the SmartFactory V8 deploy archive.")
+    parser.add_argument('--unpack', metavar='DIR', help="also sync an unpacked tree, writing only changed files")
+    parser.add_argument('--force', action='store_true', help="rebuild even if nothing changed")
+    parser.add_argument('--exit-code', action='store_true',
+                        help=f"exit with status {EXIT_UP_TO_DATE} when the archive is already up to date (0 when it was rebuilt), so a deploy pipeline can skip redeploying")
+    args = parser.parse_args()
+    changed = build(args.unpack, args.force)
+    if args.exit_code and not changed: sys.exit(EXIT_UP_TO_DATE)